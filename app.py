@@ -4,59 +4,75 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
-import stripe
 from dotenv import load_dotenv
+import database
+import instrumentation
+import static_assets
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Initialize Stripe
-stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
-
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': database.RoutingSession})
 login_manager = LoginManager()
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev-key-please-change-in-production")
+def create_app(config=None):
+    """Create and configure the Flask app.
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///porter.db")
-if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgres://"):
-    app.config["SQLALCHEMY_DATABASE_URI"] = app.config["SQLALCHEMY_DATABASE_URI"].replace("postgres://", "postgresql://", 1)
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+    Nothing here touches the database or external providers; run
+    `python commands.py migrate` to create tables, and Stripe/Twilio clients
+    are built on first use.
+    """
+    # Configure logging
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
-# Initialize extensions
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "dev-key-please-change-in-production")
 
-# User loader callback for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///porter.db")
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgres://"):
+        app.config["SQLALCHEMY_DATABASE_URI"] = app.config["SQLALCHEMY_DATABASE_URI"].replace("postgres://", "postgresql://", 1)
+    # Pool sizes, recycling and the optional read replica; see database.py
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database.engine_options()
+    app.config["SQLALCHEMY_BINDS"] = database.binds()
+
+    # Profile requests and save a cProfile dump for those slower than this (0 disables)
+    app.config["PROFILE_SLOW_REQUESTS_MS"] = int(os.environ.get("PROFILE_SLOW_REQUESTS_MS", 0))
+    app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "profiles")
+
+    if config:
+        app.config.update(config)
 
-# Import routes after app initialization to avoid circular imports
-with app.app_context():
-    from routes import auth, booking, porter, admin
+    # Initialize extensions
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.login_view = 'auth.login'
+    instrumentation.init_app(app)
+    database.init_app(app)
+    static_assets.init_app(app)
+
+    # Import routes here to avoid circular imports
+    from routes import auth, booking, porter, porter_api, admin, webhooks
     app.register_blueprint(auth.bp)
     app.register_blueprint(booking.bp)
     app.register_blueprint(porter.bp)
+    app.register_blueprint(porter_api.bp)
     app.register_blueprint(admin.bp)
+    app.register_blueprint(webhooks.bp)
+
+    return app
+
+# User loader callback for Flask-Login
+@login_manager.user_loader
+def load_user(user_id):
+    from user_cache import load_user as load_cached_user
+    return load_cached_user(int(user_id))
 
-    # Import models and create tables
-    from models import User, Porter, Booking, Rating
-    db.create_all()
+# Default app for gunicorn (main:app / app:app), commands.py and worker.py
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=os.environ.get("FLASK_ENV") == "development")
\ No newline at end of file
+    app.run(debug=os.environ.get("FLASK_ENV") == "development")
@@ -0,0 +1,89 @@
+"""
+Archive tier for finished bookings
+
+archive_bookings() moves completed and cancelled bookings booked more than
+ARCHIVE_AFTER_DAYS ago, with their ratings, into the archived_booking and
+archived_rating tables, a batch at a time with INSERT ... SELECT and DELETE,
+committing after every batch. The booking and rating tables, and the
+indexes every hot path uses, then only hold recent and open bookings.
+
+Nothing reads the archive unless asked: the dashboard and export include
+it when filtered with archive=1 / --include-archive. The booking_stat
+rollup and porter ratings already count archived bookings, and
+stats.rebuild() and ratings.reconcile() read both tiers.
+
+Run it from cron with `python commands.py archive_bookings`.
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, literal, select
+from app import db
+from models import ArchivedBooking, ArchivedRating, Booking, PorterSlot, Rating
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+
+
+def _copy_columns(model):
+    """Names of `model`'s columns, every one of which its archive table also has"""
+    return [column.key for column in model.__table__.columns]
+
+
+def _archive_batch(cutoff, batch_size, now):
+    query = (
+        select(Booking.id)
+        .where(Booking.status.in_(ARCHIVED_STATUSES), Booking.booking_time < cutoff)
+        .order_by(Booking.id)
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        # A booking being rated right now keeps its lock and waits for the next run
+        query = query.with_for_update(skip_locked=True)
+    booking_ids = db.session.scalars(query).all()
+    if not booking_ids:
+        return 0, 0
+
+    booking_columns = _copy_columns(Booking)
+    db.session.execute(
+        insert(ArchivedBooking).from_select(
+            booking_columns + ['archived_at'],
+            select(*(getattr(Booking, name) for name in booking_columns), literal(now))
+            .where(Booking.id.in_(booking_ids))
+        )
+    )
+    rating_columns = _copy_columns(Rating)
+    ratings = db.session.execute(
+        insert(ArchivedRating).from_select(
+            rating_columns,
+            select(*(getattr(Rating, name) for name in rating_columns)).where(Rating.booking_id.in_(booking_ids))
+        )
+    ).rowcount
+
+    for model, column in ((PorterSlot, PorterSlot.booking_id), (Rating, Rating.booking_id), (Booking, Booking.id)):
+        db.session.execute(
+            delete(model).where(column.in_(booking_ids)).execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return len(booking_ids), ratings
+
+
+def archive_bookings(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, now=None):
+    """Move finished bookings older than `older_than_days` to the archive.
+
+    Returns {'bookings': count, 'ratings': count}.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    counts = {'bookings': 0, 'ratings': 0}
+    while True:
+        bookings, ratings = _archive_batch(cutoff, batch_size, now)
+        if not bookings:
+            break
+        counts['bookings'] += bookings
+        counts['ratings'] += ratings
+    if counts['bookings']:
+        logger.info('Archived %d bookings and %d ratings', counts['bookings'], counts['ratings'])
+    return counts
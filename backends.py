@@ -0,0 +1,208 @@
+"""
+Shared key-value and pub/sub backend for state that must agree across workers
+
+Caches, rate limits and cache invalidation go through the backend returned
+by get_backend(). The default MemoryBackend keeps everything in this
+process, which is all a single worker needs. Set SHARED_BACKEND_URL to a
+redis:// URL to share them between gunicorn workers and nodes;
+RedisBackend accepts any client with redis-py's interface, so a stand-in
+such as fakeredis can replace the server in tests.
+
+Values are strings; use dumps() and loads() for anything richer.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class MemoryBackend:
+    """Process-local backend with per-key expiry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # key -> (value, expires_at or None)
+        self._expiries = []  # heap of (expires_at, key)
+        self._handlers = defaultdict(list)  # channel -> callbacks
+
+    def _purge(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiries)
+            entry = self._values.get(key)
+            # The key may have been set again with a later expiry
+            if entry is not None and entry[1] == expires_at:
+                del self._values[key]
+
+    def _set(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._values[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiries, (expires_at, key))
+
+    def get(self, key):
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._values.get(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def incr(self, key, ttl):
+        """Increment a counter, starting its `ttl` second expiry on the first increment"""
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._values.get(key)
+            if entry is None:
+                self._set(key, 1, ttl)
+                return 1
+            self._values[key] = (entry[0] + 1, entry[1])
+            return entry[0] + 1
+
+    def publish(self, channel, message):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        for handler in handlers:
+            handler(message)
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+
+class RedisBackend:
+    """Backend shared through Redis, or anything speaking redis-py's client interface"""
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._pubsub = None
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
+    def incr(self, key, ttl):
+        """Increment a counter, starting its `ttl` second expiry on the first increment"""
+        # One transaction, so the counter can never be left without its expiry
+        pipeline = self.client.pipeline()
+        pipeline.set(key, 0, ex=ttl, nx=True)
+        pipeline.incr(key)
+        _, count = pipeline.execute()
+        return count
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel, handler):
+        def deliver(message):
+            data = message['data']
+            handler(data.decode() if isinstance(data, bytes) else data)
+
+        with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(**{channel: deliver})
+                self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            else:
+                self._pubsub.subscribe(**{channel: deliver})
+
+
+def backend_from_url(url):
+    if not url or url == 'memory://':
+        return MemoryBackend()
+    import redis
+    return RedisBackend(redis.Redis.from_url(url))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_subscribers = []  # (channel, handler), wired into every backend
+
+
+def _wire(backend):
+    for channel, handler in _subscribers:
+        backend.subscribe(channel, handler)
+    return backend
+
+
+def get_backend():
+    """The shared backend, connected on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _wire(backend_from_url(os.environ.get('SHARED_BACKEND_URL')))
+        return _backend
+
+
+def set_backend(backend):
+    """Replace the shared backend, e.g. with RedisBackend(fakeredis.FakeRedis()) in a test"""
+    global _backend
+    with _backend_lock:
+        _backend = _wire(backend)
+
+
+def subscriber(channel):
+    """Register a function to receive every message published on `channel` by any worker"""
+    def register(handler):
+        _subscribers.append((channel, handler))
+        with _backend_lock:
+            if _backend is not None:
+                _backend.subscribe(channel, handler)
+        return handler
+    return register
+
+
+def on_commit(session, callback):
+    """Call callback() once `session` commits, e.g. so other workers never reload uncommitted rows"""
+    session.info.setdefault('on_commit', []).append(callback)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_on_commit(session):
+    for callback in session.info.pop('on_commit', ()):
+        callback()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_on_commit(session):
+    session.info.pop('on_commit', None)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _decode(value):
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+def dumps(value):
+    """JSON that round-trips datetimes"""
+    return json.dumps(value, default=_encode)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
@@ -0,0 +1,142 @@
+"""
+Shared setup for the benchmarks: environment, seeding and measurement
+
+Import this before anything that imports app, so the benchmark database and
+the fake Stripe/Twilio providers are configured first.
+"""
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///bench.db")
+os.environ.setdefault("OUTBOUND_PROVIDERS", "fake")
+
+from sqlalchemy import event, insert
+from passwords import hash_password
+from app import app, db
+from models import User, Porter, Booking
+import stats
+
+PASSWORD = "benchmark-password"
+STATIONS = ("NDLS", "BCT", "HWH", "MAS", "SBC")
+
+
+def reset_database():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def seed(users=1000, porters=200, bookings=10000, stations=STATIONS, seed_value=42):
+    """Bulk-insert customers, porters and completed historical bookings"""
+    rng = random.Random(seed_value)
+    # Hashing is deliberately slow; every seeded account shares one hash
+    password_hash = hash_password(PASSWORD)
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {"username": f"customer{i}", "email": f"customer{i}@bench.porterpro.in", "phone": f"+91{9000000000 + i}",
+             "password_hash": password_hash, "role": "customer"}
+            for i in range(users)
+        ])
+        db.session.execute(insert(User), [
+            {"username": f"porter{i}", "email": f"porter{i}@bench.porterpro.in",
+             "password_hash": password_hash, "role": "porter"}
+            for i in range(porters)
+        ])
+        porter_user_ids = [
+            user_id for user_id, in db.session.query(User.id).filter(User.role == "porter").order_by(User.id)
+        ]
+        db.session.execute(insert(Porter), [
+            {"user_id": user_id, "badge_number": f"B{i:05d}", "station": stations[i % len(stations)],
+             "available": True, "rating": 0.0, "rating_sum": 0, "total_ratings": 0}
+            for i, user_id in enumerate(porter_user_ids)
+        ])
+        customer_ids = [
+            user_id for user_id, in db.session.query(User.id).filter(User.role == "customer")
+        ]
+        porter_rows = db.session.query(Porter.id, Porter.station).all()
+
+        now = datetime.utcnow()
+        for start in range(0, bookings, 1000):
+            rows = []
+            for _ in range(min(1000, bookings - start)):
+                porter_id, station = rng.choice(porter_rows)
+                booked_at = now - timedelta(minutes=rng.randint(60, 60 * 24 * 365))
+                weight = rng.uniform(5, 60)
+                bags = rng.randint(1, 6)
+                rows.append({
+                    "user_id": rng.choice(customer_ids), "porter_id": porter_id, "station": station,
+                    "booking_time": booked_at, "status": "completed", "weight": weight,
+                    "trolley_required": False, "number_of_bags": bags, "price": max(weight * 5 + bags * 10, 100),
+                    "payment_status": "paid", "otp": f"{rng.randint(0, 999999):06d}", "otp_verified": True,
+                    "otp_expiry": booked_at + timedelta(minutes=30), "meeting_point": "Platform 1",
+                    "meeting_time": booked_at,
+                })
+            db.session.execute(insert(Booking), rows)
+        db.session.commit()
+        stats.rebuild()
+
+
+class Recorder:
+    """Collects latency and SQL query counts per route from many threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._count_query)
+
+    def _count_query(self, *args):
+        if getattr(self._local, "queries", None) is not None:
+            self._local.queries += 1
+
+    def request(self, route, send):
+        """Time `send()`, a test-client call, and record it under `route`"""
+        self._local.queries = 0
+        started = time.perf_counter()
+        try:
+            response = send()
+        except Exception:
+            response = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            self.queries[route].append(self._local.queries)
+            if response is None or response.status_code >= 400:
+                self.errors[route] += 1
+        self._local.queries = None
+        return response
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(recorder, elapsed, lifecycles=None):
+    print(f"{'route':<28}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    total_requests = 0
+    for route, latencies in recorder.latencies.items():
+        latencies = sorted(latencies)
+        queries = recorder.queries[route]
+        total_requests += len(latencies)
+        print(
+            f"{route:<28}{len(latencies):>7}{recorder.errors[route]:>8}"
+            f"{percentile(latencies, 0.50) * 1000:>9.1f}"
+            f"{percentile(latencies, 0.95) * 1000:>9.1f}"
+            f"{percentile(latencies, 0.99) * 1000:>9.1f}"
+            f"{sum(queries) / len(queries):>9.1f}"
+        )
+    if lifecycles is None:
+        print(f"\n{total_requests} requests in {elapsed:.2f}s: {total_requests / elapsed:.1f} requests/s")
+    else:
+        print(f"\n{lifecycles} booking lifecycles in {elapsed:.2f}s: "
+              f"{lifecycles / elapsed:.1f} lifecycles/s, {total_requests / elapsed:.1f} requests/s")
@@ -0,0 +1,90 @@
+"""
+Concurrent load test of the booking lifecycle
+
+Each virtual customer registers, logs in and books; the dispatched porter
+then verifies the OTP and completes the booking, and the customer rates it.
+Stripe and Twilio are replaced by in-process fakes, so nothing leaves the
+machine. Point DATABASE_URL at Postgres to benchmark against it instead of
+the default bench.db SQLite file.
+
+    python -m benchmarks.lifecycle --customers 500 --concurrency 20
+"""
+import argparse
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.common import PASSWORD, STATIONS, Recorder, app, db, report, reset_database, seed
+from dispatch import SLOT_MINUTES
+from models import Booking
+
+TRACK_URL = re.compile(r"/booking/(\d+)/track")
+
+
+def lifecycle(recorder, number):
+    customer = app.test_client()
+    porter = app.test_client()
+    email = f"load{number}-{uuid.uuid4().hex[:8]}@bench.porterpro.in"
+
+    recorder.request("register", lambda: customer.post("/register", data={
+        "username": email.split("@")[0], "email": email, "phone": f"{9000000000 + number}", "password": PASSWORD,
+        "confirm_password": PASSWORD, "role": "customer",
+    }))
+    recorder.request("login", lambda: customer.post("/login", data={"email": email, "password": PASSWORD}))
+
+    # Spread customers over the next day's meeting slots, as the slots endpoint would
+    slot = (number // len(STATIONS)) % (24 * 60 // SLOT_MINUTES)
+    meeting_time = (datetime.utcnow() + timedelta(hours=1, minutes=slot * SLOT_MINUTES)).strftime("%Y-%m-%dT%H:%M")
+    response = recorder.request("new_booking", lambda: customer.post("/booking/new", data={
+        "station": STATIONS[number % len(STATIONS)], "weight": 25, "number_of_bags": 2,
+        "meeting_point": "Platform 1", "meeting_time": meeting_time,
+    }))
+    match = TRACK_URL.search(response.location or "") if response is not None else None
+    if not match:
+        return False
+    booking_id = int(match.group(1))
+
+    # The customer would read the OTP from the SMS
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        otp, porter_email = booking.otp, booking.porter.user.email
+
+    recorder.request("porter_login", lambda: porter.post("/login", data={"email": porter_email, "password": PASSWORD}))
+    recorder.request("porter_verify_otp", lambda: porter.post("/porter/verify-otp", json={"otp": otp}))
+    recorder.request("porter_complete_booking", lambda: porter.post(f"/porter/complete-booking/{booking_id}"))
+    recorder.request("rate_booking", lambda: customer.post(f"/booking/{booking_id}/rate", data={
+        "rating": 5, "comment": "Quick and careful",
+    }))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the booking lifecycle")
+    parser.add_argument("--customers", type=int, default=200, help="Booking lifecycles to run")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--seed-porters", type=int, default=200)
+    parser.add_argument("--seed-bookings", type=int, default=10000)
+    parser.add_argument("--no-reset", action="store_true", help="Reuse the existing database")
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    if not args.no_reset:
+        reset_database()
+        seed(args.seed_users, args.seed_porters, args.seed_bookings)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda number: lifecycle(recorder, number), range(args.customers)))
+    elapsed = time.perf_counter() - started
+
+    report(recorder, elapsed, sum(results))
+    if not all(results):
+        print(f"{results.count(False)} lifecycles could not book a porter")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Login throughput under concurrency
+
+Logs seeded customers in concurrently while another client keeps hitting a
+cheap route, to show both how many logins per second the hashing pool
+sustains and how much the rest of the app slows down meanwhile. With
+--stored-method, accounts start with hashes made under another policy, so
+the first round of logins also measures rehash-on-login.
+
+    python -m benchmarks.login --logins 400 --concurrency 50 --workers 2
+    python -m benchmarks.login --stored-method pbkdf2:sha256:600000 --method scrypt:16384:8:1
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import PASSWORD, Recorder, app, db, report, reset_database, seed
+from sqlalchemy import func, select, update
+from werkzeug.security import generate_password_hash
+from models import User
+from passwords import DEFAULT_METHOD, PasswordHasher, get_hasher, set_hasher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login throughput")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--method", default=DEFAULT_METHOD, help="Hashing policy")
+    parser.add_argument("--stored-method", help="Policy the seeded hashes were made with (default --method)")
+    parser.add_argument("--workers", type=int, help="Hashing pool size (default CPU count)")
+    parser.add_argument("--queue", type=int, help="Checks allowed to wait for the pool")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    set_hasher(PasswordHasher(args.method, args.workers, args.executor, args.queue))
+    reset_database()
+    seed(users=args.users, porters=1, bookings=0)
+    if args.stored_method:
+        with app.app_context():
+            db.session.execute(update(User).values(password_hash=generate_password_hash(PASSWORD, args.stored_method)))
+            db.session.commit()
+
+    recorder = Recorder()
+    done = threading.Event()
+
+    def login(number):
+        client = app.test_client()
+        email = f"customer{number % args.users}@bench.porterpro.in"
+        recorder.request("login", lambda: client.post("/login", data={"email": email, "password": PASSWORD}))
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            recorder.request("metrics (while logging in)", lambda: client.get("/metrics"))
+            time.sleep(0.01)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+
+    report(recorder, elapsed)
+    hasher = get_hasher()
+    with app.app_context():
+        stale = db.session.scalar(
+            select(func.count()).select_from(User).where(~User.password_hash.startswith(hasher.prefix + "$"))
+        )
+    print(f"\n{args.logins / elapsed:.1f} logins/s with {hasher.workers} {hasher.executor} workers; "
+          f"{recorder.errors['login']} logins turned away or failed; {stale} accounts still on an old hash")
+
+
+if __name__ == "__main__":
+    main()
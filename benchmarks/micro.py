@@ -0,0 +1,66 @@
+"""
+Micro-benchmarks for hot helpers on the booking path
+
+    python -m benchmarks.micro
+"""
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmarks.common import app, db, reset_database, seed
+from backends import get_backend
+from dispatch import available_slots, claim_porter
+from models import User
+from pricing import quote_many
+from user_cache import load_user, user_cache
+from utils import calculate_price, verify_otp
+
+
+def bench(name, statement, number):
+    seconds = min(timeit.repeat(statement, number=number, repeat=5))
+    print(f"{name:<32}{seconds / number * 1e6:>10.2f} us/call")
+
+
+def main():
+    reset_database()
+    seed(users=100, porters=20, bookings=1000)
+
+    with app.app_context():
+        booking = SimpleNamespace(otp="123456", otp_expiry=datetime.utcnow() + timedelta(hours=1))
+        bench("calculate_price", lambda: calculate_price(23.5, 3, True, station="NDLS"), 100000)
+        bench("verify_otp", lambda: verify_otp(booking, "123456"), 100000)
+
+        weights = np.random.uniform(1, 100, 500)
+        bags = np.random.randint(1, 11, 500)
+        trolleys = np.random.rand(500) < 0.3
+        bench("quote_many (500 items)", lambda: quote_many("NDLS", weights, bags, trolleys), 2000)
+
+        porter_user_id = db.session.query(User.id).filter(User.role == "porter").first().id
+        load_user(porter_user_id)
+        bench("load_user (cache hit)", lambda: load_user(porter_user_id), 10000)
+
+        def load_user_shared():
+            user_cache.clear()
+            db.session.expunge_all()
+            load_user(porter_user_id)
+        bench("load_user (shared hit)", load_user_shared, 2000)
+
+        def load_user_uncached():
+            user_cache.clear()
+            get_backend().delete(f"user:{porter_user_id}")
+            db.session.expunge_all()
+            load_user(porter_user_id)
+        bench("load_user (cache miss)", load_user_uncached, 2000)
+
+        # Fill a day of NDLS slots, then time availability from the warm index
+        now = datetime.utcnow()
+        for i in range(200):
+            claim_porter("NDLS", now + timedelta(minutes=7 * i))
+        db.session.commit()
+        bench("available_slots (24 hours)", lambda: available_slots("NDLS", 24), 10000)
+
+
+if __name__ == "__main__":
+    main()
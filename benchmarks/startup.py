@@ -0,0 +1,69 @@
+"""
+Cold start-up time of a web or worker process
+
+Each run starts a fresh interpreter and times `import app` (module imports
+plus create_app), which is what gunicorn and worker.py pay before serving
+anything. --importtime also lists the slowest imports of one extra run.
+
+    python -m benchmarks.startup --runs 20 --importtime
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.common import percentile
+
+TIMED_IMPORT = (
+    "import time; started = time.perf_counter(); import app; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def environment():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///bench.db")
+    env.setdefault("OUTBOUND_PROVIDERS", "fake")
+    return env
+
+
+def time_import():
+    result = subprocess.run([sys.executable, "-c", TIMED_IMPORT], env=environment(),
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(count):
+    """(cumulative microseconds, module) for the slowest imports made by app.py"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=environment(),
+                            capture_output=True, text=True, check=True)
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level; keep what app.py imports directly
+        if name.startswith("   ") and not name.startswith("     "):
+            timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start-up time")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true", help="List the slowest imports")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    samples = sorted(time_import() * 1000 for _ in range(args.runs))
+    print(f"import app over {args.runs} runs: p50 {percentile(samples, 0.5):.0f} ms, "
+          f"p95 {percentile(samples, 0.95):.0f} ms, min {samples[0]:.0f} ms")
+
+    if args.importtime:
+        print(f"\n{'cumulative ms':>14}  module")
+        for cumulative, name in slowest_imports(args.top):
+            print(f"{cumulative / 1000:>14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
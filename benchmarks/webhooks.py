@@ -0,0 +1,103 @@
+"""
+Offline benchmark of Stripe webhook ingestion
+
+Generates signed checkout.session events for seeded bookings, as Stripe
+would send them after a train arrives, including retried deliveries, and
+posts them concurrently to /stripe/webhook. Then drains the stored events
+with the worker's batch consumer and checks every booking ended up paid.
+
+    python -m benchmarks.webhooks --events 5000 --concurrency 20
+"""
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import Recorder, app, db, report, reset_database, seed
+from sqlalchemy import func, select, update
+from models import Booking
+import webhooks
+
+SECRET = "whsec_benchmark"
+
+
+def fake_event(booking_id, event_type="checkout.session.completed", payment_status="paid"):
+    """A Stripe event for the checkout session of a booking"""
+    return {
+        "id": f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": event_type,
+        "created": int(time.time()),
+        "data": {"object": {
+            "id": f"cs_fake_booking-{booking_id}",
+            "object": "checkout.session",
+            "client_reference_id": str(booking_id),
+            "payment_status": payment_status,
+        }},
+    }
+
+
+def generate(booking_ids, duplicate_rate, rng):
+    """Signed (payload, header) deliveries: one payment per booking plus Stripe's retries"""
+    deliveries = []
+    for booking_id in booking_ids:
+        payload = json.dumps(fake_event(booking_id)).encode()
+        deliveries.append(payload)
+        if rng.random() < duplicate_rate:
+            deliveries.append(payload)
+    rng.shuffle(deliveries)
+    return [(payload, webhooks.sign(payload, SECRET)) for payload in deliveries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Stripe webhook ingestion")
+    parser.add_argument("--events", type=int, default=2000, help="Bookings paid for")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Share of events delivered twice")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=webhooks.APPLY_BATCH_SIZE)
+    args = parser.parse_args()
+
+    os.environ["STRIPE_WEBHOOK_SECRET"] = SECRET
+    reset_database()
+    seed(users=100, porters=20, bookings=args.events)
+    with app.app_context():
+        db.session.execute(update(Booking).values(payment_status="pending"))
+        db.session.commit()
+        booking_ids = db.session.scalars(select(Booking.id)).all()
+
+    deliveries = generate(booking_ids, args.duplicate_rate, random.Random(42))
+    client = app.test_client()
+    recorder = Recorder()
+
+    def deliver(delivery):
+        payload, header = delivery
+        recorder.request("stripe_webhook", lambda: client.post(
+            "/stripe/webhook", data=payload, headers={"Stripe-Signature": header},
+            content_type="application/json",
+        ))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(deliver, deliveries))
+    report(recorder, time.perf_counter() - started)
+
+    with app.app_context():
+        started = time.perf_counter()
+        applied = 0
+        while True:
+            count = webhooks.apply_pending(args.batch_size)
+            if not count:
+                break
+            applied += count
+        elapsed = time.perf_counter() - started
+        unpaid = db.session.scalar(select(func.count()).where(Booking.payment_status != "paid"))
+
+    print(f"\nApplied {applied} events from {len(deliveries)} deliveries in {elapsed:.2f}s "
+          f"({applied / elapsed:.0f} events/s); {unpaid} bookings not paid")
+
+
+if __name__ == "__main__":
+    main()
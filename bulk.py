@@ -0,0 +1,254 @@
+"""
+Bulk porter import and streaming booking export
+
+Imports read CSV or JSON Lines, one porter per record, and insert users and
+porters a batch at a time. Every record is checked against the unique
+badge/station, email and username constraints - within the file and then
+against the database - before its batch is written, so a bad record is
+reported and skipped instead of failing the batch.
+
+Exports stream bookings from a server-side cursor, so memory use stays flat
+however many bookings are exported.
+"""
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import insert, select
+from app import db
+from dashboard import booking_conditions
+from models import ArchivedBooking, Booking, Porter, User
+from passwords import hash_password
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+
+# Column lengths from models.py
+PORTER_FIELDS = {
+    'username': 64,
+    'email': 120,
+    'phone': 20,
+    'badge_number': 20,
+    'station': 100,
+    'photo_path': 255,
+}
+REQUIRED_FIELDS = ('username', 'email', 'badge_number', 'station')
+
+EXPORT_COLUMNS = (
+    ('booking_id', Booking.id),
+    ('booking_time', Booking.booking_time),
+    ('station', Booking.station),
+    ('status', Booking.status),
+    ('payment_status', Booking.payment_status),
+    ('customer_email', User.email),
+    ('porter_badge', Porter.badge_number),
+    ('weight', Booking.weight),
+    ('number_of_bags', Booking.number_of_bags),
+    ('trolley_required', Booking.trolley_required),
+    ('price', Booking.price),
+    ('meeting_point', Booking.meeting_point),
+    ('meeting_time', Booking.meeting_time),
+    ('otp_verified', Booking.otp_verified),
+)
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, record) from a CSV or JSON Lines stream; record is None if unreadable"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def _clean(record):
+    """Return (fields, error) for one porter record"""
+    if record is None:
+        return None, 'not a valid record'
+
+    fields = {}
+    for name, max_length in PORTER_FIELDS.items():
+        value = record.get(name)
+        value = str(value).strip() if value is not None else ''
+        if len(value) > max_length:
+            return None, f'{name} is longer than {max_length} characters'
+        fields[name] = value or None
+
+    missing = [name for name in REQUIRED_FIELDS if not fields[name]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    fields['password'] = record.get('password') or None
+    return fields, None
+
+
+class _SeenKeys:
+    """Unique keys already used earlier in the file, with the line that used them"""
+
+    def __init__(self):
+        self.badges = {}
+        self.emails = {}
+        self.usernames = {}
+
+    def claim(self, line_number, fields):
+        badge = (fields['badge_number'], fields['station'])
+        for seen, key, label in (
+            (self.badges, badge, 'badge_number and station'),
+            (self.emails, fields['email'], 'email'),
+            (self.usernames, fields['username'], 'username'),
+        ):
+            if key in seen:
+                return f'{label} already used on line {seen[key]}'
+        self.badges[badge] = self.emails[fields['email']] = self.usernames[fields['username']] = line_number
+        return None
+
+
+def _taken_in_database(batch):
+    """Unique keys from this batch that already exist in the database"""
+    badges = {fields['badge_number'] for _, fields in batch}
+    stations = {fields['station'] for _, fields in batch}
+    emails = [fields['email'] for _, fields in batch]
+    usernames = [fields['username'] for _, fields in batch]
+
+    taken_badges = set(db.session.execute(
+        select(Porter.badge_number, Porter.station)
+        .where(Porter.badge_number.in_(badges), Porter.station.in_(stations))
+    ).tuples())
+    taken_emails = set(db.session.scalars(select(User.email).where(User.email.in_(emails))))
+    taken_usernames = set(db.session.scalars(select(User.username).where(User.username.in_(usernames))))
+    return taken_badges, taken_emails, taken_usernames
+
+
+def _insert_batch(batch, default_password_hash):
+    """Insert the records that do not clash with the database; return their errors"""
+    taken_badges, taken_emails, taken_usernames = _taken_in_database(batch)
+
+    errors = []
+    users = []
+    porters = []
+    for line_number, fields in batch:
+        if (fields['badge_number'], fields['station']) in taken_badges:
+            errors.append((line_number, 'badge_number is already registered at this station'))
+            continue
+        if fields['email'] in taken_emails:
+            errors.append((line_number, 'email is already registered'))
+            continue
+        if fields['username'] in taken_usernames:
+            errors.append((line_number, 'username is already taken'))
+            continue
+
+        password_hash = hash_password(fields['password']) if fields['password'] else default_password_hash
+        users.append({
+            'username': fields['username'],
+            'email': fields['email'],
+            'phone': fields['phone'],
+            'password_hash': password_hash,
+            'role': 'porter',
+        })
+        porters.append({
+            'badge_number': fields['badge_number'],
+            'station': fields['station'],
+            'photo_path': fields['photo_path'],
+        })
+
+    if users:
+        user_ids = db.session.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True), users
+        ).all()
+        db.session.execute(insert(Porter), [
+            dict(porter, user_id=user_id) for porter, user_id in zip(porters, user_ids)
+        ])
+    db.session.commit()
+    return len(users), errors
+
+
+def import_porters(records, default_password=None, batch_size=IMPORT_BATCH_SIZE):
+    """Create porter users and profiles from (line_number, record) pairs.
+
+    Records without a password get `default_password`, which is hashed once
+    for the whole import. Each batch is committed on its own.
+    Returns (imported, errors) where errors is a list of (line_number, message).
+    """
+    default_password_hash = hash_password(default_password) if default_password else None
+    seen = _SeenKeys()
+    imported = 0
+    errors = []
+
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            return imported, errors
+
+        batch = []
+        for line_number, record in chunk:
+            fields, error = _clean(record)
+            if not error and not fields['password'] and not default_password_hash:
+                error = 'no password given and no default password set'
+            if not error:
+                error = seen.claim(line_number, fields)
+            if error:
+                errors.append((line_number, error))
+            else:
+                batch.append((line_number, fields))
+
+        if batch:
+            count, batch_errors = _insert_batch(batch, default_password_hash)
+            imported += count
+            errors.extend(batch_errors)
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _export_rows(model, conditions, chunk_size):
+    columns = [
+        getattr(model, column.key) if column.class_ is Booking else column
+        for _, column in EXPORT_COLUMNS
+    ]
+    return db.session.execute(
+        select(*columns)
+        .join(User, model.user_id == User.id)
+        .join(Porter, model.porter_id == Porter.id)
+        .where(*conditions)
+        .order_by(model.id)
+        # Fetch chunk_size rows at a time from a server-side cursor where the driver has one
+        .execution_options(yield_per=chunk_size)
+    )
+
+
+def _export_results(filters, chunk_size):
+    models = (Booking, ArchivedBooking) if filters and filters.get('archive') else (Booking,)
+    for model in models:
+        yield _export_rows(model, booking_conditions(filters, model) if filters else [], chunk_size)
+
+
+def export_bookings(out, fmt='csv', filters=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write bookings matching dashboard-style `filters` to `out` as CSV or JSON Lines.
+
+    With filters['archive'], archived bookings follow the live ones.
+    Returns the number of bookings written.
+    """
+    names = [name for name, _ in EXPORT_COLUMNS]
+    written = 0
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(names)
+    for result in _export_results(filters, chunk_size):
+        for row in result:
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(dict(zip(names, map(_json_value, row)))) + '\n')
+            written += 1
+    return written
@@ -1,9 +1,26 @@
 """
 Management commands for the Porter Booking System
 """
+import os
+import sys
 from werkzeug.security import generate_password_hash
 from app import app, db
 from models import User
+from database import reading_from_replica
+import archive
+import bulk
+import dispatch
+import passes
+import ratings
+import schema
+import static_assets
+import stats
+import sweeper
+
+def migrate():
+    """Create missing tables and add the columns and indexes existing ones lack"""
+    with app.app_context():
+        return schema.upgrade()
 
 def create_admin(email, username, password):
     """Create an admin user"""
@@ -18,14 +35,164 @@ def create_admin(email, username, password):
         db.session.commit()
         return user
 
+def rebuild_booking_stats(chunk_size=1000):
+    """Rebuild the per station/day booking rollup from the booking table"""
+    with app.app_context():
+        return stats.rebuild(chunk_size)
+
+def reconcile_porter_ratings(batch_size=1000):
+    """Recompute porter rating aggregates from the rating table"""
+    with app.app_context():
+        return ratings.reconcile(batch_size)
+
+def backfill_porter_slots(chunk_size=1000):
+    """Reserve meeting slots for active bookings made before slot scheduling"""
+    with app.app_context():
+        return dispatch.backfill_slots(chunk_size=chunk_size)
+
+def sweep(batch_size=sweeper.BATCH_SIZE):
+    """Expire OTPs, cancel stale bookings, free porters and purge old jobs"""
+    with app.app_context():
+        return sweeper.sweep(batch_size=batch_size)
+
+def _file_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if os.path.splitext(path)[1] in ('.jsonl', '.ndjson') else 'csv'
+
+def import_porters(path, fmt=None, default_password=None, batch_size=bulk.IMPORT_BATCH_SIZE):
+    """Import porters from a CSV or JSON Lines file"""
+    with app.app_context(), open(path, newline='', encoding='utf-8') as stream:
+        records = bulk.read_records(stream, _file_format(path, fmt))
+        return bulk.import_porters(records, default_password, batch_size)
+
+def export_bookings(path, fmt=None, filters=None, chunk_size=bulk.EXPORT_CHUNK_SIZE):
+    """Export bookings to a CSV or JSON Lines file, or stdout if path is '-'"""
+    with app.app_context(), reading_from_replica():
+        if path == '-':
+            return bulk.export_bookings(sys.stdout, fmt or 'csv', filters, chunk_size)
+        with open(path, 'w', newline='', encoding='utf-8') as out:
+            return bulk.export_bookings(out, _file_format(path, fmt), filters, chunk_size)
+
+def archive_bookings(older_than_days=archive.ARCHIVE_AFTER_DAYS, batch_size=archive.ARCHIVE_BATCH_SIZE):
+    """Move old completed and cancelled bookings to the archive tables"""
+    with app.app_context():
+        return archive.archive_bookings(older_than_days, batch_size)
+
+def pregenerate_passes():
+    """Render the passes of bookings meeting in the next hour"""
+    with app.app_context():
+        return passes.pregenerate()
+
+def build_static():
+    """Fingerprint and pre-compress the static folder; restart the web processes to serve the result"""
+    return static_assets.build(app.static_folder)
+
 if __name__ == "__main__":
     # Example usage:
+    # python commands.py migrate
     # python commands.py create_admin admin@example.com admin password123
-    import sys
-    if len(sys.argv) != 4:
-        print("Usage: python commands.py <email> <username> <password>")
-        sys.exit(1)
-
-    _, email, username, password = sys.argv
-    create_admin(email, username, password)
-    print(f"Admin user '{username}' created successfully!")
\ No newline at end of file
+    # python commands.py rebuild_booking_stats --chunk-size 5000
+    # python commands.py reconcile_porter_ratings
+    # python commands.py backfill_porter_slots
+    # python commands.py sweep
+    # python commands.py import_porters porters.csv --default-password changeme123
+    # python commands.py export_bookings bookings-2024-05.csv --date-from 2024-05-01 --date-to 2024-05-31
+    # python commands.py pregenerate_passes
+    # python commands.py archive_bookings --older-than-days 90
+    # python commands.py build_static
+    import argparse
+    from datetime import datetime
+    from dashboard import BOOKING_STATUSES
+
+    def date(value):
+        return datetime.strptime(value, "%Y-%m-%d")
+
+    parser = argparse.ArgumentParser(description="PorterPro management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="Create missing tables, columns and indexes")
+
+    create_admin_parser = subparsers.add_parser("create_admin", help="Create an admin user")
+    create_admin_parser.add_argument("email")
+    create_admin_parser.add_argument("username")
+    create_admin_parser.add_argument("password")
+
+    rebuild_parser = subparsers.add_parser("rebuild_booking_stats", help="Rebuild the booking rollup")
+    rebuild_parser.add_argument("--chunk-size", type=int, default=1000)
+
+    reconcile_parser = subparsers.add_parser("reconcile_porter_ratings", help="Recompute porter ratings")
+    reconcile_parser.add_argument("--batch-size", type=int, default=1000)
+
+    backfill_parser = subparsers.add_parser("backfill_porter_slots", help="Reserve slots for existing bookings")
+    backfill_parser.add_argument("--chunk-size", type=int, default=1000)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Expire OTPs, cancel stale bookings and free porters")
+    sweep_parser.add_argument("--batch-size", type=int, default=sweeper.BATCH_SIZE)
+
+    import_parser = subparsers.add_parser("import_porters", help="Import porters from CSV or JSON Lines")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the file extension")
+    import_parser.add_argument("--default-password", help="Password for records without one")
+    import_parser.add_argument("--batch-size", type=int, default=bulk.IMPORT_BATCH_SIZE)
+
+    export_parser = subparsers.add_parser("export_bookings", help="Export bookings to CSV or JSON Lines")
+    export_parser.add_argument("path", help="Output file, or - for stdout")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the file extension")
+    export_parser.add_argument("--status", choices=BOOKING_STATUSES)
+    export_parser.add_argument("--station")
+    export_parser.add_argument("--date-from", type=date, help="YYYY-MM-DD")
+    export_parser.add_argument("--date-to", type=date, help="YYYY-MM-DD, inclusive")
+    export_parser.add_argument("--chunk-size", type=int, default=bulk.EXPORT_CHUNK_SIZE)
+    export_parser.add_argument("--include-archive", action="store_true", help="Also export archived bookings")
+
+    archive_parser = subparsers.add_parser("archive_bookings", help="Move old finished bookings to the archive")
+    archive_parser.add_argument("--older-than-days", type=int, default=archive.ARCHIVE_AFTER_DAYS)
+    archive_parser.add_argument("--batch-size", type=int, default=archive.ARCHIVE_BATCH_SIZE)
+
+    subparsers.add_parser("pregenerate_passes", help="Render PDF passes for bookings meeting in the next hour")
+    subparsers.add_parser("build_static", help="Fingerprint and pre-compress static assets")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        changes = migrate()
+        for kind in ("tables", "columns", "indexes"):
+            if changes[kind]:
+                print(f"Added {kind}: {', '.join(changes[kind])}")
+        for name in changes["skipped"]:
+            print(f"Skipped unique index {name}: existing rows have duplicates", file=sys.stderr)
+        print("Database schema is up to date")
+    elif args.command == "create_admin":
+        create_admin(args.email, args.username, args.password)
+        print(f"Admin user '{args.username}' created successfully!")
+    elif args.command == "rebuild_booking_stats":
+        counted = rebuild_booking_stats(args.chunk_size)
+        print(f"Rebuilt booking stats from {counted} bookings")
+    elif args.command == "reconcile_porter_ratings":
+        fixed = reconcile_porter_ratings(args.batch_size)
+        print(f"Reconciled ratings for {fixed} porters")
+    elif args.command == "backfill_porter_slots":
+        reserved = backfill_porter_slots(args.chunk_size)
+        print(f"Reserved {reserved} porter slots")
+    elif args.command == "sweep":
+        counts = sweep(args.batch_size)
+        print(", ".join(f"{name.replace('_', ' ')}: {count}" for name, count in counts.items()))
+    elif args.command == "import_porters":
+        imported, errors = import_porters(args.path, args.format, args.default_password, args.batch_size)
+        for line_number, message in errors:
+            print(f"line {line_number}: {message}", file=sys.stderr)
+        print(f"Imported {imported} porters, skipped {len(errors)} records")
+    elif args.command == "export_bookings":
+        filters = {"status": args.status, "station": args.station,
+                   "date_from": args.date_from, "date_to": args.date_to, "archive": args.include_archive}
+        exported = export_bookings(args.path, args.format, filters, args.chunk_size)
+        print(f"Exported {exported} bookings", file=sys.stderr)
+    elif args.command == "archive_bookings":
+        counts = archive_bookings(args.older_than_days, args.batch_size)
+        print(f"Archived {counts['bookings']} bookings and {counts['ratings']} ratings")
+    elif args.command == "pregenerate_passes":
+        rendered = pregenerate_passes()
+        print(f"Rendered {rendered} passes")
+    elif args.command == "build_static":
+        manifest = build_static()
+        print(f"Built {len(manifest)} static assets")
@@ -0,0 +1,145 @@
+"""
+Queries behind the admin dashboard: keyset-paginated listings and SQL summaries
+
+Booking listings only read the archive when filtered with archive=1.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload
+from app import db
+from models import ArchivedBooking, Booking, BookingStat, Porter
+
+PAGE_SIZE = 50
+BOOKING_STATUSES = ('pending', 'confirmed', 'in_progress', 'completed', 'cancelled')
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_filters(args):
+    """Read dashboard filters from the query string, dropping invalid values"""
+    status = args.get('status')
+    return {
+        'status': status if status in BOOKING_STATUSES else None,
+        'station': args.get('station') or None,
+        'date_from': _parse_date(args.get('date_from')),
+        'date_to': _parse_date(args.get('date_to')),
+        'archive': args.get('archive') == '1',
+    }
+
+
+def booking_conditions(filters, model=Booking):
+    """SQL conditions for filters returned by parse_filters, on Booking or ArchivedBooking"""
+    conditions = []
+    if filters['status']:
+        conditions.append(model.status == filters['status'])
+    if filters['station']:
+        conditions.append(model.station == filters['station'])
+    if filters['date_from']:
+        conditions.append(model.booking_time >= filters['date_from'])
+    if filters['date_to']:
+        # date_to is inclusive
+        conditions.append(model.booking_time < filters['date_to'] + timedelta(days=1))
+    return conditions
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _booking_rows(model, filters, before, limit):
+    query = (
+        model.query
+        .options(joinedload(model.user), joinedload(model.porter).joinedload(Porter.user))
+        .filter(*booking_conditions(filters, model))
+        .order_by(model.id.desc())
+    )
+    if before is not None:
+        query = query.filter(model.id < before)
+    return query.limit(limit).all()
+
+
+def booking_page(filters, before=None, limit=PAGE_SIZE):
+    """Return (bookings, next_cursor), newest first, with user and porter loaded.
+
+    Archived bookings are merged in by id when filters['archive'] is set.
+    """
+    before = _cursor(before)
+    bookings = _booking_rows(Booking, filters, before, limit + 1)
+    if filters.get('archive'):
+        # Bookings keep their ids when archived, so one cursor pages through both tables
+        archived = _booking_rows(ArchivedBooking, filters, before, limit + 1)
+        bookings = sorted(bookings + archived, key=lambda booking: booking.id, reverse=True)[:limit + 1]
+
+    if len(bookings) > limit:
+        return bookings[:limit], bookings[limit - 1].id
+    return bookings, None
+
+
+def porter_page(filters, after=None, limit=PAGE_SIZE):
+    """Return (porters, next_cursor) in id order, with users loaded"""
+    query = Porter.query.options(joinedload(Porter.user)).order_by(Porter.id)
+    if filters['station']:
+        query = query.filter(Porter.station == filters['station'])
+    after = _cursor(after)
+    if after is not None:
+        query = query.filter(Porter.id > after)
+
+    porters = query.limit(limit + 1).all()
+    if len(porters) > limit:
+        return porters[:limit], porters[limit - 1].id
+    return porters, None
+
+
+def _stat_conditions(filters):
+    conditions = []
+    if filters['status']:
+        conditions.append(BookingStat.status == filters['status'])
+    if filters['station']:
+        conditions.append(BookingStat.station == filters['station'])
+    if filters['date_from']:
+        conditions.append(BookingStat.day >= filters['date_from'].date())
+    if filters['date_to']:
+        conditions.append(BookingStat.day <= filters['date_to'].date())
+    return conditions
+
+
+def summary(filters):
+    """Counts, revenue and porter utilization for the dashboard tiles"""
+    # Booking totals come from the booking_stat rollup rather than the booking table
+    totals = (
+        db.session.query(
+            BookingStat.status,
+            func.sum(BookingStat.booking_count),
+            func.sum(BookingStat.price_total)
+        )
+        .filter(*_stat_conditions(filters))
+        .group_by(BookingStat.status)
+        .all()
+    )
+    status_counts = {status: count for status, count, _ in totals}
+    revenue = sum(price_total for status, _, price_total in totals if status == 'completed')
+
+    porter_query = db.session.query(
+        func.count(Porter.id),
+        func.coalesce(func.sum(case((Porter.available.is_(False), 1), else_=0)), 0)
+    )
+    if filters['station']:
+        porter_query = porter_query.filter(Porter.station == filters['station'])
+    total_porters, busy_porters = porter_query.one()
+
+    return {
+        'total_bookings': sum(status_counts.values()),
+        'status_counts': {status: status_counts.get(status, 0) for status in BOOKING_STATUSES},
+        'revenue': revenue,
+        'total_porters': total_porters,
+        'busy_porters': busy_porters,
+        'utilization': busy_porters / total_porters if total_porters else 0.0,
+    }
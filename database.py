@@ -0,0 +1,172 @@
+"""
+Database engine settings, read replica routing and reconnect handling
+
+Pool sizes come from the environment so each deployment can match them to
+its worker count: every worker process holds up to DB_POOL_SIZE +
+DB_MAX_OVERFLOW connections, and the total across processes must stay under
+the server's connection limit.
+
+Connections are not pinged on checkout. A connection the server has dropped
+fails its first statement instead; SQLAlchemy then invalidates the pool so
+the next checkout reconnects, and the request answers 503 with Retry-After
+rather than a 500.
+
+Set DATABASE_REPLICA_URL to send the SELECTs of views wrapped in
+@read_replica (and code run inside `with reading_from_replica():`) to a
+replica. Writes, SELECT ... FOR UPDATE and flushes always go to the
+primary, as does every read for REPLICA_LAG_SECONDS after the same browser
+session wrote something, so a user never reads a replica that has not yet
+caught up with their own booking.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import g, has_request_context, jsonify, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+# How long after a write the same browser session keeps reading from the primary, in seconds
+REPLICA_LAG_SECONDS = 5
+RECONNECT_RETRY_AFTER = 1
+
+_POOL_SETTINGS = (
+    ('pool_size', 'DB_POOL_SIZE', int),
+    ('max_overflow', 'DB_MAX_OVERFLOW', int),
+    ('pool_timeout', 'DB_POOL_TIMEOUT', float),
+)
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def engine_options(environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for this deployment"""
+    options = {
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 300)),
+        # Off by default: disconnects are handled when they happen instead of pinging every checkout
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', '').lower() in ('1', 'true', 'yes'),
+    }
+    for option, name, parse in _POOL_SETTINGS:
+        if environ.get(name):
+            options[option] = parse(environ[name])
+    return options
+
+
+def binds(environ=os.environ):
+    """SQLALCHEMY_BINDS for this deployment: the replica, if one is configured"""
+    url = environ.get('DATABASE_REPLICA_URL')
+    if not url:
+        return {}
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return {REPLICA_BIND: url}
+
+
+class RoutingSession(Session):
+    """Session sending reads to the replica while replica reads are enabled"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and _is_plain_select(clause) and not self._flushing:
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_plain_select(clause):
+    return clause is not None and getattr(clause, 'is_select', False) \
+        and getattr(clause, '_for_update_arg', None) is None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_statement(state):
+    if not state.is_select:
+        state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def _primary_pinned():
+    return has_request_context() and session.get('primary_until', 0) > time.time()
+
+
+@contextmanager
+def reading_from_replica():
+    """Send plain SELECTs in this block to the replica, e.g. for a report"""
+    token = _use_replica.set(not _primary_pinned())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def reading_from_primary():
+    """Read from the primary in this block, even within reading_from_replica()"""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_replica(f):
+    """Serve a read-only view from the replica"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with reading_from_replica():
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+def upsert_insert(model):
+    """INSERT into `model`'s table with the engine's ON CONFLICT clauses"""
+    from app import db
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _pin_to_primary(response):
+    if g.get('db_wrote'):
+        session['primary_until'] = time.time() + REPLICA_LAG_SECONDS
+    return response
+
+
+def _database_error(error):
+    if not error.connection_invalidated:
+        raise error
+    # The pool has been invalidated, so the retry gets a fresh connection
+    from app import db
+    db.session.rollback()
+    logger.warning('Database connection lost, pool invalidated: %s', error.orig)
+    response = jsonify({'error': 'Database temporarily unavailable'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RECONNECT_RETRY_AFTER)
+    return response
+
+
+def init_app(app):
+    app.after_request(_pin_to_primary)
+    app.register_error_handler(DBAPIError, _database_error)
@@ -0,0 +1,272 @@
+"""
+Porter dispatch: reserves a porter at a station for a booking's meeting time
+
+Time is divided into SLOT_MINUTES slots. A booking holds its porter for
+every slot overlapping [meeting_time, meeting_time + SERVICE_DURATION), one
+porter_slot row per slot, and the unique (porter_id, slot_start) constraint
+makes the reservation atomic across workers.
+
+Each process keeps an index of which porters hold which slots per station,
+reloaded every SLOT_INDEX_TTL seconds, so availability is answered from
+memory. Other workers reserve slots too, so the index is only ever a hint;
+the constraint decides. A porter's available flag says whether they are on
+a job right now; one still on a job (running over, say) is not offered for
+the current slot.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from app import db
+from database import upsert_insert
+from models import Booking, Porter, PorterSlot
+
+SLOT_MINUTES = 30
+SLOT = timedelta(minutes=SLOT_MINUTES)
+# How long a booking holds its porter from the meeting time
+SERVICE_DURATION = timedelta(minutes=30)
+# How long a station's cached index is trusted before it is reloaded, in seconds
+SLOT_INDEX_TTL = 30
+MAX_LOOKAHEAD_HOURS = 48
+
+
+def slot_start(moment):
+    """Start of the slot containing `moment`"""
+    minutes = moment.hour * 60 + moment.minute
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + timedelta(minutes=minutes - minutes % SLOT_MINUTES)
+
+
+def booking_slots(meeting_time):
+    """Starts of the slots a booking at `meeting_time` holds its porter for"""
+    slots = []
+    start = slot_start(meeting_time)
+    while start < meeting_time + SERVICE_DURATION:
+        slots.append(start)
+        start += SLOT
+    return slots
+
+
+class StationSlots:
+    """Porters at one station, those on a job now, and the porters holding each slot"""
+
+    def __init__(self, porters, reservations):
+        self.porters = {porter_id: rating or 0.0 for porter_id, rating, _ in porters}
+        self.on_job = {porter_id for porter_id, _, available in porters if available is False}
+        self.held = defaultdict(set)  # slot start -> porter ids
+        for porter_id, start in reservations:
+            self.held[start].add(porter_id)
+
+    def _busy(self, slots, now):
+        busy = set()
+        for start in slots:
+            busy |= self.held.get(start, set())
+        if slot_start(now) in slots:
+            busy |= self.on_job
+        return busy
+
+    def free_porters(self, slots, now):
+        """Porters holding none of `slots`, best rated first"""
+        busy = self._busy(slots, now)
+        free = [porter_id for porter_id in self.porters if porter_id not in busy]
+        return sorted(free, key=lambda porter_id: (-self.porters[porter_id], porter_id))
+
+    def free_count(self, slots, now):
+        # Reservations may belong to porters who have since moved station
+        return len(self.porters) - sum(1 for porter_id in self._busy(slots, now) if porter_id in self.porters)
+
+
+class SlotIndex:
+    """In-process index of reserved slots per station"""
+
+    def __init__(self, ttl=SLOT_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stations = {}  # station -> (loaded_at, StationSlots)
+
+    def _get(self, station):
+        entry = self._stations.get(station)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def is_fresh(self, station):
+        with self._lock:
+            return self._get(station) is not None
+
+    def load(self, station, porters, reservations):
+        """Replace a station's index with (porter_id, rating, available) and (porter_id, slot_start) rows"""
+        slots = StationSlots(porters, reservations)
+        with self._lock:
+            self._stations[station] = (time.monotonic(), slots)
+
+    def candidates(self, station, slots, now):
+        with self._lock:
+            entry = self._get(station)
+            return entry.free_porters(slots, now) if entry else []
+
+    def availability(self, station, starts, now):
+        """(start, free porters) for a booking at each slot start"""
+        with self._lock:
+            entry = self._get(station)
+            return [(start, entry.free_count(booking_slots(start), now) if entry else 0) for start in starts]
+
+    def reserve(self, station, porter_id, slots):
+        with self._lock:
+            entry = self._get(station)
+            if entry is not None:
+                for start in slots:
+                    entry.held[start].add(porter_id)
+
+    def release(self, station, porter_id, slots):
+        with self._lock:
+            entry = self._get(station)
+            if entry is not None:
+                for start in slots:
+                    entry.held.get(start, set()).discard(porter_id)
+
+    def set_on_job(self, station, porter_id, on_job):
+        with self._lock:
+            entry = self._get(station)
+            if entry is not None:
+                if on_job:
+                    entry.on_job.add(porter_id)
+                else:
+                    entry.on_job.discard(porter_id)
+
+    def clear(self):
+        with self._lock:
+            self._stations.clear()
+
+
+slot_index = SlotIndex()
+
+
+def _load_station(station, now=None):
+    now = now or datetime.utcnow()
+    porters = db.session.execute(
+        select(Porter.id, Porter.rating, Porter.available).where(Porter.station == station)
+    ).all()
+    reservations = db.session.execute(
+        select(PorterSlot.porter_id, PorterSlot.slot_start).where(
+            PorterSlot.station == station,
+            PorterSlot.slot_start >= slot_start(now)
+        )
+    ).all()
+    slot_index.load(station, porters, reservations)
+
+
+def available_slots(station, hours, now=None):
+    """Return (slot start, free porters) for each slot starting in the next `hours` hours"""
+    now = now or datetime.utcnow()
+    if not slot_index.is_fresh(station):
+        _load_station(station, now)
+    first = slot_start(now)
+    if first < now:
+        first += SLOT
+    count = int(min(hours, MAX_LOOKAHEAD_HOURS) * 60 // SLOT_MINUTES)
+    return slot_index.availability(station, [first + SLOT * i for i in range(count)], now)
+
+
+def _reserve(station, porter_id, slots):
+    """Insert a porter's slot rows; None if another booking holds one of them.
+
+    Conflicting rows are skipped rather than raising, so nothing but plain
+    INSERT and DELETE statements runs in the caller's transaction; a
+    savepoint would open that transaction itself on SQLite and commit the
+    rows when released.
+    """
+    rows = [{'porter_id': porter_id, 'station': station, 'slot_start': start} for start in slots]
+    reservation = db.session.scalars(
+        upsert_insert(PorterSlot).values(rows)
+        .on_conflict_do_nothing(index_elements=['porter_id', 'slot_start'])
+        .returning(PorterSlot)
+    ).all()
+    if len(reservation) < len(slots):
+        # Hand back the slots that were free; another booking holds the rest
+        db.session.execute(delete(PorterSlot).where(PorterSlot.id.in_([slot.id for slot in reservation])))
+        return None
+    return reservation
+
+
+def claim_porter(station, meeting_time, now=None):
+    """Reserve the best rated porter free at a station for a meeting time.
+
+    Returns (porter, slots), where slots are the PorterSlot rows to attach
+    to the booking, or None if nobody is free then. The slot rows are
+    inserted in the caller's transaction, so a rollback hands them back.
+    """
+    now = now or datetime.utcnow()
+    slots = booking_slots(meeting_time)
+    for attempt in range(2):
+        if attempt or not slot_index.is_fresh(station):
+            # First use, stale, or every cached candidate was taken by another worker
+            _load_station(station, now)
+        for porter_id in slot_index.candidates(station, slots, now):
+            reservation = _reserve(station, porter_id, slots)
+            if reservation is not None:
+                slot_index.reserve(station, porter_id, slots)
+                return db.session.get(Porter, porter_id), reservation
+    return None
+
+
+def release_slots(booking):
+    """Hand back the slots a booking holds, e.g. once it is completed"""
+    released = db.session.execute(
+        delete(PorterSlot)
+        .where(PorterSlot.booking_id == booking.id)
+        .returning(PorterSlot.station, PorterSlot.slot_start)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for station, start in released:
+        slot_index.release(station, booking.porter_id, [start])
+
+
+def mark_busy(porter):
+    """Flag a porter as on a job, so they are not offered for the current slot"""
+    porter.available = False
+    slot_index.set_on_job(porter.station, porter.id, True)
+
+
+def release_porter(porter):
+    """Flag a porter as off their last job"""
+    porter.available = True
+    slot_index.set_on_job(porter.station, porter.id, False)
+
+
+def backfill_slots(now=None, chunk_size=1000):
+    """Reserve slots for pending and in-progress bookings made before slots existed.
+
+    Bookings that overlap one already holding their porter are left as they
+    are. Returns the number of slots reserved.
+    """
+    now = now or datetime.utcnow()
+    last_id = 0
+    reserved = 0
+    while True:
+        bookings = db.session.execute(
+            select(Booking.id, Booking.porter_id, Porter.station, Booking.meeting_time)
+            .join(Porter, Booking.porter_id == Porter.id)
+            .where(
+                Booking.id > last_id,
+                Booking.status.in_(('pending', 'in_progress')),
+                Booking.meeting_time >= now - SERVICE_DURATION
+            )
+            .order_by(Booking.id)
+            .limit(chunk_size)
+        ).all()
+        if not bookings:
+            slot_index.clear()
+            return reserved
+
+        rows = [
+            {'porter_id': porter_id, 'booking_id': booking_id, 'station': station, 'slot_start': start}
+            for booking_id, porter_id, station, meeting_time in bookings
+            for start in booking_slots(meeting_time)
+        ]
+        reserved += db.session.execute(
+            upsert_insert(PorterSlot).values(rows).on_conflict_do_nothing(index_elements=['porter_id', 'slot_start'])
+        ).rowcount
+        db.session.commit()
+        last_id = bookings[-1].id
@@ -0,0 +1,131 @@
+"""
+Booking status events for live tracking
+
+Routes publish a booking's status after committing a change; the tracking
+stream and long-poll endpoints subscribe to the booking's channel. Events
+travel through the shared backend (see backends.py), so with
+SHARED_BACKEND_URL set a change made in one gunicorn worker reaches
+streams held open by every other; each worker then hands them to its own
+subscribers.
+"""
+import queue
+import threading
+from collections import defaultdict
+from backends import dumps, get_backend, loads, subscriber
+from page_cache import invalidate_booking
+
+TERMINAL_STATUSES = ('completed', 'cancelled')
+
+# One backend channel carries every booking's events; bookings come and go
+# too quickly to subscribe the backend to each of them
+STATUS_CHANNEL = 'events:booking_status'
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self.messages = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout=None):
+        """Return the next message, or None if none arrives within timeout"""
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def deliver(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            # A stalled client only misses intermediate statuses; the next one still arrives
+            pass
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InProcessBroker:
+    """Delivers messages to subscribers in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+class BackendBroker(InProcessBroker):
+    """Publishes through the shared backend, which relays messages to this broker in every worker"""
+
+    def publish(self, channel, message):
+        get_backend().publish(STATUS_CHANNEL, dumps({'channel': channel, 'message': message}))
+
+    def deliver(self, channel, message):
+        super().publish(channel, message)
+
+
+_broker = BackendBroker()
+
+
+@subscriber(STATUS_CHANNEL)
+def _relay(text):
+    broker = get_broker()
+    if isinstance(broker, BackendBroker):
+        event = loads(text)
+        broker.deliver(event['channel'], event['message'])
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    global _broker
+    _broker = broker
+
+
+def booking_channel(booking_id):
+    return f'booking:{booking_id}'
+
+
+def status_message(booking):
+    return {
+        'booking_id': booking.id,
+        'status': booking.status,
+        'otp_verified': booking.otp_verified,
+    }
+
+
+def publish_status(booking):
+    """Announce a booking's committed status to anyone tracking it"""
+    invalidate_booking(booking.id)
+    get_broker().publish(booking_channel(booking.id), status_message(booking))
+
+
+def subscribe(booking_id):
+    return get_broker().subscribe(booking_channel(booking_id))
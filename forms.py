@@ -26,11 +26,16 @@ class LoginForm(FlaskForm):
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=64)])
     email = StringField('Email', validators=[DataRequired(), Email()])
+    phone = StringField('Phone Number', validators=[
+        DataRequired(),
+        Regexp(r'^\d{10}$', message='Phone number must be exactly 10 digits')
+    ])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=8)])
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
     role = SelectField('Role', choices=[('customer', 'Customer'), ('porter', 'Porter')], validators=[DataRequired()])
 
 class BookingForm(FlaskForm):
+    station = StringField('Station', validators=[DataRequired(), Length(max=100)])
     weight = FloatField('Total Weight (kg)', validators=[DataRequired(), NumberRange(min=1, max=100)])
     number_of_bags = IntegerField('Number of Bags', validators=[DataRequired(), NumberRange(min=1, max=10)])
     trolley_required = BooleanField('Trolley Required')
@@ -0,0 +1,182 @@
+"""
+Per-request instrumentation and a Prometheus-style /metrics endpoint
+
+Every request records its latency, SQL query count, time spent in the
+database and time spent in external calls (Stripe, Twilio) against its
+endpoint. Set PROFILE_SLOW_REQUESTS_MS to profile requests and keep a
+cProfile dump in PROFILE_DIR for those slower than the threshold.
+"""
+import cProfile
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class Metrics:
+    """Process-wide counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(Histogram)  # endpoint -> Histogram
+        self.requests = defaultdict(int)  # (endpoint, method, status) -> count
+        self.queries = defaultdict(int)  # endpoint -> count
+        self.db_seconds = defaultdict(float)  # endpoint -> seconds
+        self.external_seconds = defaultdict(float)  # (endpoint, provider) -> seconds
+        self.external_calls = defaultdict(Histogram)  # provider -> Histogram
+
+    def observe_request(self, endpoint, method, status, latency, stats):
+        with self._lock:
+            self.latency[endpoint].observe(latency)
+            self.requests[(endpoint, method, status)] += 1
+            self.queries[endpoint] += stats['queries']
+            self.db_seconds[endpoint] += stats['db_seconds']
+            for provider, seconds in stats['external'].items():
+                self.external_seconds[(endpoint, provider)] += seconds
+
+    def observe_external(self, provider, seconds):
+        with self._lock:
+            self.external_calls[provider].observe(seconds)
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def histogram(name, help_text, label, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for value, hist in sorted(histograms.items()):
+                for bound, count in zip(BUCKETS, hist.buckets):
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+
+        def counter(name, help_text, labels, values):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(values.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                label_text = ','.join(f'{label}="{part}"' for label, part in zip(labels, key))
+                lines.append(f'{name}{{{label_text}}} {value}')
+
+        with self._lock:
+            histogram('porterpro_request_duration_seconds', 'Request latency by endpoint', 'endpoint', self.latency)
+            counter('porterpro_requests_total', 'Requests by endpoint, method and status',
+                    ('endpoint', 'method', 'status'), self.requests)
+            counter('porterpro_db_queries_total', 'SQL statements run by endpoint', ('endpoint',), self.queries)
+            counter('porterpro_db_seconds_total', 'Time spent in SQL by endpoint', ('endpoint',), self.db_seconds)
+            counter('porterpro_external_seconds_total', 'Time spent calling external providers by endpoint',
+                    ('endpoint', 'provider'), self.external_seconds)
+            histogram('porterpro_external_call_duration_seconds', 'External provider call latency',
+                      'provider', self.external_calls)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _request_stats():
+    if has_app_context():
+        return g.get('request_stats')
+    return None
+
+
+@contextmanager
+def track_external(provider):
+    """Time a call to an external provider such as 'stripe' or 'twilio'"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe_external(provider, elapsed)
+        stats = _request_stats()
+        if stats is not None:
+            stats['external'][provider] = stats['external'].get(provider, 0.0) + elapsed
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = _request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['db_seconds'] += time.perf_counter() - started
+
+
+def _start_request():
+    g.request_stats = {'queries': 0, 'db_seconds': 0.0, 'external': {}}
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if current_app.config.get('PROFILE_SLOW_REQUESTS_MS'):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except (RuntimeError, ValueError):
+            # Another request in this process is already being profiled
+            pass
+
+
+def _finish_request(response):
+    latency = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    stats = g.request_stats
+    metrics.observe_request(endpoint, request.method, response.status_code, latency, stats)
+
+    if g.profiler is not None:
+        g.profiler.disable()
+        if latency * 1000 >= current_app.config['PROFILE_SLOW_REQUESTS_MS']:
+            _dump_profile(g.profiler, endpoint, latency, stats)
+        g.profiler = None
+    return response
+
+
+def _dump_profile(profiler, endpoint, latency, stats):
+    directory = current_app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{endpoint}-{int(time.time() * 1000)}-{int(latency * 1000)}ms.prof')
+    profiler.dump_stats(path)
+    logger.warning(
+        'Slow request %s %s: %.0f ms, %d queries, %.0f ms in SQL, external %s; profile saved to %s',
+        request.method, request.path, latency * 1000, stats['queries'], stats['db_seconds'] * 1000,
+        {provider: round(seconds * 1000) for provider, seconds in stats['external'].items()}, path
+    )
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,196 @@
+"""
+Durable outbound job queue backed by the job table
+
+Requests enqueue jobs in the same transaction as the rows they refer to and
+return straight away; worker.py claims due jobs in batches and runs them,
+retrying failures with exponential backoff.
+"""
+import logging
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from app import db
+from models import Booking, Job
+from providers import get_payment_provider
+from utils import send_otp_sms
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2  # seconds before the first retry, doubled on every attempt
+BACKOFF_CAP = 300
+# A running job whose worker has not reported back in this long is handed out again
+LEASE = timedelta(minutes=5)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that runs jobs of a given kind"""
+    def register(f):
+        HANDLERS[kind] = f
+        return f
+    return register
+
+
+def enqueue(kind, idempotency_key, **payload):
+    """Queue a job as part of the caller's transaction.
+
+    A job already queued under the same idempotency key is returned instead
+    of queueing a duplicate.
+    """
+    job = Job.query.filter_by(idempotency_key=idempotency_key).first()
+    if job is None:
+        job = Job(kind=kind, idempotency_key=idempotency_key, payload=payload)
+        db.session.add(job)
+    return job
+
+
+def backoff(attempts):
+    """Delay before retrying a job that has failed `attempts` times, with jitter"""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def requeue_stale(now=None):
+    """Hand out jobs again whose worker died mid-run"""
+    now = now or datetime.utcnow()
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.updated_at < now - LEASE)
+        .values(status='pending', updated_at=now)
+    )
+    db.session.commit()
+
+
+def claim_batch(limit, now=None):
+    """Mark up to `limit` due jobs as running and return them"""
+    now = now or datetime.utcnow()
+    due = (
+        select(Job.id)
+        .where(Job.status == 'pending', Job.run_at <= now)
+        .order_by(Job.run_at)
+        .limit(limit)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        due = due.with_for_update(skip_locked=True)
+
+    # Only rows still pending are claimed, so concurrent workers never share a job
+    claimed_ids = db.session.execute(
+        update(Job)
+        .where(Job.id.in_(due.scalar_subquery()), Job.status == 'pending')
+        .values(status='running', attempts=Job.attempts + 1, updated_at=now)
+        .returning(Job.id)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed_ids:
+        return []
+    return Job.query.filter(Job.id.in_(claimed_ids)).order_by(Job.run_at).all()
+
+
+def _savepoints_nest():
+    """Whether a savepoint nests inside the session's transaction.
+
+    pysqlite only opens a transaction at the first write, so on SQLite a
+    savepoint taken before one would open the transaction itself, and
+    releasing it would commit.
+    """
+    return db.engine.dialect.name != 'sqlite'
+
+
+def run_job(job, now=None, savepoint=None):
+    """Run a job and record the outcome on it.
+
+    With `savepoint` (the default where savepoints nest), a failing
+    handler's partial writes are rolled back to a savepoint and the rest of
+    the transaction is kept. Without, the whole transaction is rolled back,
+    so the caller must commit after every job.
+    """
+    now = now or datetime.utcnow()
+    if savepoint is None:
+        savepoint = _savepoints_nest()
+    try:
+        if savepoint:
+            with db.session.begin_nested():
+                HANDLERS[job.kind](job.payload)
+        else:
+            HANDLERS[job.kind](job.payload)
+            db.session.flush()
+        job.status = 'done'
+        job.last_error = None
+    except Exception as e:
+        if not savepoint:
+            db.session.rollback()
+        logger.warning('Job %s (%s) attempt %s failed: %s', job.id, job.kind, job.attempts, e)
+        job.last_error = str(e)
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            job.run_at = now + backoff(job.attempts)
+
+
+def run_batch(batch_size=50):
+    """Run one batch of due jobs. Returns the number of jobs run.
+
+    The batch commits once, each job in its own savepoint; on SQLite, where
+    savepoints do not nest, every job commits on its own instead.
+    """
+    jobs = claim_batch(batch_size)
+    savepoint = _savepoints_nest()
+    for job in jobs:
+        run_job(job, savepoint=savepoint)
+        if not savepoint:
+            db.session.commit()
+    db.session.commit()
+    return len(jobs)
+
+
+def enqueue_booking_jobs(booking, phone, host_url):
+    """Queue the Stripe checkout session and OTP SMS for a new booking.
+
+    Returns whether the SMS was queued; see enqueue_otp_sms().
+    """
+    enqueue(
+        'stripe_checkout', f'stripe_checkout:{booking.id}',
+        booking_id=booking.id,
+        # Payment status arrives through the Stripe webhook, so both return to tracking
+        success_url=host_url + f'booking/{booking.id}/track',
+        cancel_url=host_url + f'booking/{booking.id}/track',
+    )
+    return enqueue_otp_sms(booking, phone)
+
+
+def enqueue_otp_sms(booking, phone):
+    """Queue the booking's OTP SMS; returns False, queueing nothing, without a phone to send it to"""
+    if not phone:
+        return False
+    # Keyed by OTP as well, so a resend queues a fresh message but a retry does not
+    enqueue('otp_sms', f'otp_sms:{booking.id}:{booking.otp}', booking_id=booking.id, phone=phone, otp=booking.otp)
+    return True
+
+
+@handler('stripe_checkout')
+def create_checkout_session(payload):
+    booking = db.session.get(Booking, payload['booking_id'])
+    if booking is None or booking.stripe_session_id:
+        return
+    checkout_session = get_payment_provider().create_checkout_session(
+        amount=booking.price,
+        success_url=payload['success_url'],
+        cancel_url=payload['cancel_url'],
+        idempotency_key=f'booking-{booking.id}',
+        # Lets the webhook find the booking even before stripe_session_id is saved
+        client_reference_id=str(booking.id),
+    )
+    booking.stripe_session_id = checkout_session.id
+
+
+@handler('otp_sms')
+def send_booking_otp(payload):
+    booking = db.session.get(Booking, payload['booking_id'])
+    # Skip OTPs that have since been resent or used
+    if booking is None or booking.otp != payload['otp'] or booking.otp_verified:
+        return
+    if not send_otp_sms(payload['phone'], payload['otp']):
+        raise RuntimeError('SMS provider did not accept the message')
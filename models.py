@@ -1,21 +1,26 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import get_hasher
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    phone = db.Column(db.String(20))
     password_hash = db.Column(db.String(256))
     role = db.Column(db.String(20), nullable=False, default='customer')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Raises PasswordHasherBusy if too many checks are already waiting"""
+        return get_hasher().check(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return get_hasher().needs_rehash(self.password_hash)
 
 class Porter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,12 +31,15 @@ class Porter(db.Model):
     available = db.Column(db.Boolean, default=True)
     current_location = db.Column(db.String(100))
     rating = db.Column(db.Float, default=0.0)
+    rating_sum = db.Column(db.Integer, default=0)
     total_ratings = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Add unique constraint for badge number per station
     __table_args__ = (
         db.UniqueConstraint('badge_number', 'station', name='unique_badge_station'),
+        # Dispatch looks up free porters per station
+        db.Index('ix_porter_station_available', 'station', 'available'),
     )
 
     user = db.relationship('User', backref=db.backref('porter', uselist=False))
@@ -42,6 +50,7 @@ class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     porter_id = db.Column(db.Integer, db.ForeignKey('porter.id'), nullable=False)
+    station = db.Column(db.String(100), index=True)
     booking_time = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, in_progress, completed, cancelled
     weight = db.Column(db.Float, nullable=False)
@@ -49,20 +58,151 @@ class Booking(db.Model):
     number_of_bags = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     payment_status = db.Column(db.String(20), default='pending')
-    stripe_session_id = db.Column(db.String(100))
+    stripe_session_id = db.Column(db.String(100), index=True)
     otp = db.Column(db.String(6))
     otp_expiry = db.Column(db.DateTime)
     otp_verified = db.Column(db.Boolean, default=False)
     meeting_point = db.Column(db.String(200))  # Where to meet at the station
     meeting_time = db.Column(db.DateTime)  # When to meet
 
+    user = db.relationship('User', backref=db.backref('bookings', lazy=True))
     rating = db.relationship('Rating', backref='booking', lazy=True, uselist=False)
+    slots = db.relationship('PorterSlot', backref='booking', lazy=True)
+
+    # Porters look up bookings by OTP. On Postgres only pending, unverified OTPs
+    # are indexed; SQLite cannot match a partial index against bound parameters.
+    __table_args__ = (
+        db.Index(
+            'ix_booking_active_otp', 'porter_id', 'otp',
+            postgresql_where=db.text("status = 'pending' AND otp_verified = false"),
+        ),
+        # A porter's queue of open bookings by meeting time
+        db.Index('ix_booking_porter_status_meeting', 'porter_id', 'status', 'meeting_time'),
+        # Finished bookings old enough to archive
+        db.Index('ix_booking_status_time', 'status', 'booking_time'),
+    )
 
 class Rating(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    # One rating per booking, however many times the form is posted
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, index=True, unique=True)
+    porter_id = db.Column(db.Integer, db.ForeignKey('porter.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rating = db.Column(db.Integer, nullable=False)
+    comment = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PorterSlot(db.Model):
+    """A porter held for one scheduling slot by a booking; maintained by dispatch.py"""
+    id = db.Column(db.Integer, primary_key=True)
     porter_id = db.Column(db.Integer, db.ForeignKey('porter.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), index=True)
+    station = db.Column(db.String(100), nullable=False)
+    slot_start = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # A porter can only be held once per slot, however many workers are booking
+        db.UniqueConstraint('porter_id', 'slot_start', name='unique_porter_slot'),
+        db.Index('ix_porter_slot_station_start', 'station', 'slot_start'),
+    )
+
+class Tariff(db.Model):
+    """Pricing rules for a station; the row with no station is the default"""
+    id = db.Column(db.Integer, primary_key=True)
+    station = db.Column(db.String(100), unique=True)
+    per_kg = db.Column(db.Float, nullable=False, default=5.0)
+    per_bag = db.Column(db.Float, nullable=False, default=10.0)
+    trolley_fee = db.Column(db.Float, nullable=False, default=200.0)
+    minimum_charge = db.Column(db.Float, nullable=False, default=100.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BookingStat(db.Model):
+    """Bookings rolled up per station, day and status; maintained by stats.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    station = db.Column(db.String(100), nullable=False)  # '' for bookings without a station
+    day = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    price_total = db.Column(db.Float, nullable=False, default=0.0)
+    weight_total = db.Column(db.Float, nullable=False, default=0.0)
+    rating_total = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('station', 'day', 'status', name='unique_station_day_status'),
+    )
+
+    @property
+    def avg_weight(self):
+        return self.weight_total / self.booking_count if self.booking_count else 0.0
+
+    @property
+    def avg_rating(self):
+        return self.rating_total / self.rating_count if self.rating_count else 0.0
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # The worker polls for due pending jobs
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+class StripeEvent(db.Model):
+    """A Stripe webhook event, stored once per event id and applied by webhooks.py"""
+    id = db.Column(db.String(255), primary_key=True)  # Stripe's evt_... id
+    type = db.Column(db.String(100), nullable=False)
+    booking_id = db.Column(db.Integer)
+    session_id = db.Column(db.String(100))
+    payment_status = db.Column(db.String(20))  # what the event sets Booking.payment_status to
+    created = db.Column(db.DateTime, nullable=False)  # when Stripe created the event
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    # The consumer polls for unprocessed events in the order Stripe created them
+    __table_args__ = (
+        db.Index('ix_stripe_event_processed_created', 'processed_at', 'created'),
+    )
+
+class ArchivedBooking(db.Model):
+    """A finished booking moved out of the booking table by archive.py, keeping its id"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    porter_id = db.Column(db.Integer, db.ForeignKey('porter.id'), nullable=False, index=True)
+    station = db.Column(db.String(100))
+    booking_time = db.Column(db.DateTime, index=True)
+    status = db.Column(db.String(20))
+    weight = db.Column(db.Float, nullable=False)
+    trolley_required = db.Column(db.Boolean)
+    number_of_bags = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    payment_status = db.Column(db.String(20))
+    stripe_session_id = db.Column(db.String(100))
+    otp = db.Column(db.String(6))
+    otp_expiry = db.Column(db.DateTime)
+    otp_verified = db.Column(db.Boolean)
+    meeting_point = db.Column(db.String(200))
+    meeting_time = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User', viewonly=True)
+    porter = db.relationship('Porter', viewonly=True)
+
+class ArchivedRating(db.Model):
+    """The rating of an archived booking"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('archived_booking.id'), nullable=False, index=True)
+    porter_id = db.Column(db.Integer, db.ForeignKey('porter.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime)
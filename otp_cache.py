@@ -0,0 +1,49 @@
+"""
+OTP lookup for porters verifying bookings at the gate
+
+Pending OTPs are kept in the shared backend, keyed by porter and OTP, until
+they expire, so any worker can resolve one without scanning bookings.
+"""
+from datetime import datetime
+from app import db
+from models import Booking
+from backends import get_backend
+
+
+def _key(porter_id, otp):
+    return f'otp:{porter_id}:{otp}'
+
+
+def remember_otp(booking):
+    """Cache a booking's current OTP until it expires"""
+    if not (booking.otp and booking.otp_expiry):
+        return
+    ttl = int((booking.otp_expiry - datetime.utcnow()).total_seconds())
+    if ttl > 0:
+        get_backend().set(_key(booking.porter_id, booking.otp), str(booking.id), ttl)
+
+
+def forget_otp(booking):
+    if booking.otp:
+        get_backend().delete(_key(booking.porter_id, booking.otp))
+
+
+def find_pending_booking(porter_id, otp):
+    """Find the pending, unverified booking assigned to a porter with this OTP"""
+    booking_id = get_backend().get(_key(porter_id, otp))
+    if booking_id is not None:
+        # Re-check the row: another worker may have verified or resent it
+        booking = db.session.get(Booking, int(booking_id))
+        if booking and booking.otp == otp and booking.status == 'pending' and not booking.otp_verified:
+            return booking
+        get_backend().delete(_key(porter_id, otp))
+
+    booking = Booking.query.filter_by(
+        porter_id=porter_id,
+        otp=otp,
+        status='pending',
+        otp_verified=False
+    ).first()
+    if booking:
+        remember_otp(booking)
+    return booking
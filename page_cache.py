@@ -0,0 +1,61 @@
+"""
+Cache of rendered pages in the shared backend
+
+A page is cached per viewer (their user id and CSRF session token, so
+forms stay valid) and per version of what it shows. A booking's version is
+a counter bumped whenever its status, payment or rating changes, so a
+changed booking is simply looked up under a new key and the old pages
+expire after PAGE_CACHE_TTL seconds. Requests with flashed messages pending
+are always rendered, as are pages whose rendering starts a CSRF session.
+
+Pages are rendered from the primary database before they are cached, even
+in @read_replica views: a replica still behind a change would otherwise
+store the old page under the new version. Cached views therefore gain
+nothing from @read_replica.
+"""
+import hashlib
+from flask import session
+from flask_login import current_user
+from backends import get_backend
+from database import reading_from_primary
+
+PAGE_CACHE_TTL = 60
+# Outlives every page cached under the version it counts
+VERSION_TTL = 24 * 60 * 60
+
+
+def _version_key(booking_id):
+    return f'page_version:booking:{booking_id}'
+
+
+def booking_version(booking_id):
+    return get_backend().get(_version_key(booking_id)) or '0'
+
+
+def invalidate_booking(booking_id):
+    """Stop serving cached pages that show this booking; call after committing the change"""
+    get_backend().incr(_version_key(booking_id), VERSION_TTL)
+
+
+def _viewer():
+    csrf = session.get('csrf_token')
+    token = hashlib.sha256(csrf.encode()).hexdigest()[:16] if csrf else '-'
+    return f'{current_user.get_id() or "anonymous"}:{token}'
+
+
+def cached_page(name, render, version='0'):
+    """Return render()'s HTML, reusing the copy rendered for this viewer at this version"""
+    if session.get('_flashes'):
+        return render()
+    key = f'page:{name}:{version}:{_viewer()}'
+    backend = get_backend()
+    html = backend.get(key)
+    if html is not None:
+        return html
+
+    csrf = session.get('csrf_token')
+    with reading_from_primary():
+        html = render()
+    if session.get('csrf_token') == csrf:
+        backend.set(key, html, PAGE_CACHE_TTL)
+    return html
@@ -0,0 +1,234 @@
+"""
+PDF boarding passes for bookings
+
+A pass shows the booking ID, the porter's badge, the meeting point and time
+and the OTP, also as a QR code for the porter to scan. Passes are rendered
+with WeasyPrint on a pool of PASS_WORKERS processes and stored in
+PASS_CACHE_DIR under a hash of everything printed on them, so a repeat
+download is a file send and a changed booking (a resent OTP, say) gets a
+new file without anything to invalidate. Concurrent requests for the same
+pass share one render.
+
+pregenerate() renders the passes of bookings meeting in the next hour ahead
+of the rush; run it with `python commands.py pregenerate_passes` or
+`python worker.py --pass-interval 300`. It also deletes passes unused for
+PASS_RETENTION.
+"""
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import db
+from models import Booking, Porter, User
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes so existing passes are rendered again
+PASS_LAYOUT_VERSION = 1
+PREGENERATE_WINDOW = timedelta(hours=1)
+PASS_RETENTION = timedelta(days=2)
+RENDER_TIMEOUT = 30
+
+PASS_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><style>
+@page {{ size: A6; margin: 8mm; }}
+body {{ font-family: sans-serif; font-size: 10pt; }}
+h1 {{ font-size: 14pt; margin: 0 0 4mm; }}
+dt {{ color: #666; font-size: 8pt; margin-top: 2mm; }}
+dd {{ margin: 0; font-weight: bold; }}
+.otp {{ font-size: 20pt; letter-spacing: 2mm; }}
+img {{ width: 35mm; height: 35mm; float: right; }}
+</style></head><body>
+<img src="data:image/svg+xml;base64,{qr}" alt="">
+<h1>PorterPro pass #{booking_id}</h1>
+<dl>
+<dt>Passenger</dt><dd>{customer}</dd>
+<dt>Station</dt><dd>{station}</dd>
+<dt>Meeting point</dt><dd>{meeting_point}</dd>
+<dt>Meeting time</dt><dd>{meeting_time}</dd>
+<dt>Porter badge</dt><dd>{badge_number}</dd>
+<dt>Bags</dt><dd>{bags}{trolley}</dd>
+<dt>OTP</dt><dd class="otp">{otp}</dd>
+</dl>
+</body></html>
+"""
+
+
+def cache_dir():
+    return os.environ.get('PASS_CACHE_DIR', 'passes')
+
+
+def _pass_query():
+    return (
+        select(
+            Booking.id, Booking.user_id, Booking.station, Booking.meeting_point, Booking.meeting_time,
+            Booking.number_of_bags, Booking.trolley_required, Booking.otp,
+            Porter.badge_number, User.username
+        )
+        .join(Porter, Booking.porter_id == Porter.id)
+        .join(User, Booking.user_id == User.id)
+    )
+
+
+def pass_fields(row):
+    """Everything printed on a booking's pass, from a _pass_query() row"""
+    return {
+        'booking_id': row.id,
+        'customer': row.username,
+        'station': row.station or '',
+        'meeting_point': row.meeting_point or '',
+        'meeting_time': row.meeting_time.strftime('%d %b %Y, %H:%M') if row.meeting_time else '',
+        'badge_number': row.badge_number,
+        'bags': row.number_of_bags,
+        'trolley': row.trolley_required,
+        'otp': row.otp or '',
+    }
+
+
+def pass_path(fields):
+    """Where the pass with these fields is cached: named by a hash of its content"""
+    content = json.dumps([PASS_LAYOUT_VERSION, fields], sort_keys=True)
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    return os.path.join(cache_dir(), digest[:2], f'{digest}.pdf')
+
+
+def qr_svg(data):
+    """An SVG QR code for `data`"""
+    import qrcode
+    import qrcode.image.svg
+    image = qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage, border=1)
+    return image.to_string()
+
+
+def render_pass(fields, path):
+    """Render a pass to `path`; runs in the pool's processes"""
+    import base64
+    from weasyprint import HTML
+
+    qr = qr_svg(f"PORTERPRO:{fields['booking_id']}:{fields['otp']}") if fields['otp'] else b''
+    values = {key: html.escape(str(value)) for key, value in fields.items()}
+    values['trolley'] = ' + trolley' if fields['trolley'] else ''
+    document = PASS_HTML.format(qr=base64.b64encode(qr).decode(), **values)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name so a reader never sees half a file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    HTML(string=document).write_pdf(temporary)
+    os.replace(temporary, path)
+    return path
+
+
+class PassRenderer:
+    """Renders passes on a process pool, one render per path at a time"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.environ.get('PASS_WORKERS', 2))
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = {}  # path -> Future
+
+    def submit(self, fields):
+        """Future for the pass file of `fields`, already resolved if it is cached"""
+        path = pass_path(fields)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            if os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+                return future
+            if self._pool is None:
+                # Spawned, not forked: request threads may hold locks at fork time
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            future = self._pool.submit(render_pass, fields, path)
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._forget(path))
+        return future
+
+    def _forget(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+renderer = PassRenderer()
+
+
+def booking_pass(booking_id, user_id=None):
+    """Path of a booking's pass, rendering it if needed.
+
+    With `user_id`, returns None unless the booking is theirs; also None if
+    there is no such booking.
+    """
+    query = _pass_query().where(Booking.id == booking_id)
+    if user_id is not None:
+        query = query.where(Booking.user_id == user_id)
+    row = db.session.execute(query).first()
+    if row is None:
+        return None
+    fields = pass_fields(row)
+    path = pass_path(fields)
+    if os.path.exists(path):
+        return path
+    # Do not hold a database connection while the pass renders
+    db.session.close()
+    return renderer.submit(fields).result(timeout=RENDER_TIMEOUT)
+
+
+def purge(max_age=PASS_RETENTION):
+    """Delete cached passes not downloaded or rendered within `max_age`"""
+    cutoff = time.time() - max_age.total_seconds()
+    removed = 0
+    for directory, _, files in os.walk(cache_dir()):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                if max(os.path.getatime(path), os.path.getmtime(path)) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def pregenerate(now=None, window=PREGENERATE_WINDOW):
+    """Render the passes of pending bookings meeting within `window`; returns the number rendered"""
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        _pass_query().where(
+            Booking.status == 'pending',
+            Booking.meeting_time.between(now, now + window)
+        )
+    ).all()
+    # The session is not needed while the pool works
+    db.session.close()
+
+    futures = [
+        renderer.submit(fields) for fields in map(pass_fields, rows)
+        if not os.path.exists(pass_path(fields))
+    ]
+    rendered = 0
+    for future in futures:
+        try:
+            future.result(timeout=RENDER_TIMEOUT)
+            rendered += 1
+        except Exception:
+            logger.exception('Rendering a pass failed')
+    removed = purge()
+    if rendered or removed:
+        logger.info('Passes: rendered %d, purged %d', rendered, removed)
+    return rendered
+
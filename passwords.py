@@ -0,0 +1,112 @@
+"""
+Password hashing policy and a bounded pool for checking passwords
+
+Hashing is deliberately slow, so a burst of logins (a shift change, the
+morning rush) would otherwise take every request thread. Checks and hashes
+run on a pool of PASSWORD_HASH_WORKERS threads, or processes with
+PASSWORD_HASH_EXECUTOR=process; at most PASSWORD_HASH_QUEUE more wait for
+it, and further logins are turned away with PasswordHasherBusy rather than
+queueing behind them.
+
+PASSWORD_HASH_METHOD is any werkzeug method, e.g. "scrypt:32768:8:1" or
+"pbkdf2:sha256:600000". Stored hashes made with other parameters keep
+working and are replaced the next time their user logs in.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+# Checks allowed to wait per pool worker; at roughly 50 ms per scrypt check that is under two seconds
+PENDING_PER_WORKER = 32
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password checks are already waiting"""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a bounded pool with one hashing policy"""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=None, executor='thread', max_pending=None):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.max_pending = self.workers * PENDING_PER_WORKER if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        # Only the part before the salt identifies the parameters, e.g. "scrypt:32768:8:1"
+        self.prefix = generate_password_hash('', method=method).split('$', 1)[0]
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password checks are waiting')
+        try:
+            with self._lock:
+                if self._pool is None:
+                    if self.executor == 'process':
+                        # Spawned, not forked: request threads may hold locks at fork time
+                        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._submit(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other parameters than the policy's"""
+        return bool(password_hash) and password_hash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def hasher_from_env(environ=os.environ):
+    workers = environ.get('PASSWORD_HASH_WORKERS')
+    queue = environ.get('PASSWORD_HASH_QUEUE')
+    return PasswordHasher(
+        method=environ.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD,
+        workers=int(workers) if workers else None,
+        executor=environ.get('PASSWORD_HASH_EXECUTOR') or 'thread',
+        max_pending=int(queue) if queue else None,
+    )
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """The process's hasher, configured from the environment on first use"""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = hasher_from_env()
+        return _hasher
+
+
+def set_hasher(hasher):
+    """Replace the hasher, e.g. with another policy in a benchmark"""
+    global _hasher
+    with _hasher_lock:
+        previous, _hasher = _hasher, hasher
+    if previous is not None:
+        previous.shutdown()
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
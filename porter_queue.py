@@ -0,0 +1,136 @@
+"""
+Porter work queue and status updates for the versioned porter API
+
+A porter's queue is their pending and in-progress bookings, read together
+with each customer's name and phone in one query and serialised with only
+the fields a handheld shows. Status updates arrive in batches so a handheld
+that lost its connection can replay what it did offline in one request.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select
+from app import db
+from models import Booking, Porter, User
+from dispatch import SERVICE_DURATION, mark_busy, release_porter, release_slots
+from otp_cache import forget_otp
+from stats import transition
+from events import publish_status
+from utils import verify_otp
+
+QUEUE_HOURS = 12
+QUEUE_STATUSES = ('pending', 'in_progress')
+MAX_STATUS_UPDATES = 20
+
+# (current status, requested status) -> whether the update must carry the customer's OTP
+PORTER_TRANSITIONS = {
+    ('pending', 'in_progress'): True,
+    ('in_progress', 'completed'): False,
+}
+
+
+def porter_queue(porter_id, hours=QUEUE_HOURS, now=None):
+    """A porter's in-progress bookings and pending ones meeting in the next `hours` hours"""
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        select(
+            Booking.id, Booking.status, Booking.meeting_time, Booking.meeting_point,
+            Booking.weight, Booking.number_of_bags, Booking.trolley_required,
+            Booking.payment_status, User.username, User.phone
+        )
+        .join(User, Booking.user_id == User.id)
+        .where(
+            Booking.porter_id == porter_id,
+            Booking.status.in_(QUEUE_STATUSES),
+            or_(
+                Booking.status == 'in_progress',
+                Booking.meeting_time.between(now - SERVICE_DURATION, now + timedelta(hours=hours))
+            )
+        )
+        .order_by(Booking.meeting_time, Booking.id)
+    ).all()
+    return [
+        {
+            'id': row.id,
+            'status': row.status,
+            'meeting_time': row.meeting_time.isoformat() if row.meeting_time else None,
+            'meeting_point': row.meeting_point,
+            'weight': row.weight,
+            'bags': row.number_of_bags,
+            'trolley': row.trolley_required,
+            'paid': row.payment_status == 'paid',
+            'customer': row.username,
+            'phone': row.phone,
+        }
+        for row in rows
+    ]
+
+
+def _parse_updates(updates):
+    if not isinstance(updates, list) or not updates:
+        raise ValueError('updates must be a non-empty list')
+    if len(updates) > MAX_STATUS_UPDATES:
+        raise ValueError(f'At most {MAX_STATUS_UPDATES} updates per request')
+    for update in updates:
+        if not isinstance(update, dict) or not isinstance(update.get('id'), int) \
+                or not isinstance(update.get('status'), str):
+            raise ValueError('Each update needs an integer id and a status')
+    return updates
+
+
+def apply_status_updates(porter_id, updates):
+    """Apply a porter's status updates in order, committing once.
+
+    `updates` is a list of {'id', 'status'} dicts, with the customer's
+    'otp' when starting a booking. Each update succeeds or fails on its
+    own, except that OTP checks stop after the first wrong one. Returns one
+    {'id', 'status'} or {'id', 'error'} per update.
+    Raises ValueError if the request itself is malformed.
+    """
+    updates = _parse_updates(updates)
+    bookings = {
+        booking.id: booking
+        for booking in Booking.query.filter(
+            Booking.id.in_({update['id'] for update in updates}),
+            Booking.porter_id == porter_id
+        )
+    }
+    porter = db.session.get(Porter, porter_id)
+
+    results = []
+    changed = {}
+    started = []
+    otp_failed = False
+    for update in updates:
+        booking = bookings.get(update['id'])
+        if booking is None:
+            results.append({'id': update['id'], 'error': 'Booking not found'})
+            continue
+        needs_otp = PORTER_TRANSITIONS.get((booking.status, update['status']))
+        if needs_otp is None:
+            results.append({'id': booking.id, 'error': f'Cannot move a {booking.status} booking to {update["status"]}'})
+            continue
+        if needs_otp:
+            # One wrong OTP per request, so the rate limit bounds guesses as for a single verify
+            if otp_failed:
+                results.append({'id': booking.id, 'error': 'Skipped after an invalid OTP'})
+                continue
+            if not verify_otp(booking, update.get('otp')):
+                otp_failed = True
+                results.append({'id': booking.id, 'error': 'Invalid or expired OTP'})
+                continue
+            booking.otp_verified = True
+            mark_busy(porter)
+            started.append(booking)
+        else:
+            release_porter(porter)
+            release_slots(booking)
+        transition(booking, update['status'])
+        changed[booking.id] = booking
+        results.append({'id': booking.id, 'status': booking.status})
+
+    if changed:
+        db.session.commit()
+        for booking in started:
+            forget_otp(booking)
+        for booking in changed.values():
+            publish_status(booking)
+    return results
@@ -0,0 +1,137 @@
+"""
+Tariff-based pricing
+
+Tariffs live in the tariff table, one row per station plus an optional
+default row with no station. They are compiled into an in-memory book that
+every worker drops once a tariff change commits, and that is otherwise
+reloaded every TARIFF_TTL seconds.
+"""
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from models import Tariff
+from backends import get_backend, on_commit, subscriber
+
+TARIFF_TTL = 60
+INVALIDATION_CHANNEL = 'tariffs:invalidate'
+
+TariffRule = namedtuple('TariffRule', ['per_kg', 'per_bag', 'trolley_fee', 'minimum_charge'])
+
+# Used when the tariff table has no default row
+DEFAULT_RULE = TariffRule(per_kg=5.0, per_bag=10.0, trolley_fee=200.0, minimum_charge=100.0)
+
+
+class TariffBook:
+    """Compiled tariff rules per station"""
+
+    def __init__(self, ttl=TARIFF_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = None
+        self._default = DEFAULT_RULE
+        self._loaded_at = 0.0
+
+    def _load(self):
+        rules = {}
+        default = DEFAULT_RULE
+        for tariff in Tariff.query.all():
+            rule = TariffRule(tariff.per_kg, tariff.per_bag, tariff.trolley_fee, tariff.minimum_charge)
+            if tariff.station is None:
+                default = rule
+            else:
+                rules[tariff.station] = rule
+        return rules, default
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._rules is not None and time.monotonic() - self._loaded_at <= self.ttl:
+                return self._rules, self._default
+        rules, default = self._load()
+        with self._lock:
+            self._rules, self._default, self._loaded_at = rules, default, time.monotonic()
+        return rules, default
+
+    def rule_for(self, station):
+        rules, default = self._ensure_loaded()
+        return rules.get(station, default)
+
+    def rule_arrays(self, stations):
+        """Per-item arrays of (per_kg, per_bag, trolley_fee, minimum_charge) for an array of stations"""
+        import numpy as np
+        rules, default = self._ensure_loaded()
+        unique_stations, index = np.unique(stations, return_inverse=True)
+        table = np.array([rules.get(station, default) for station in unique_stations], dtype=float).reshape(-1, 4)
+        return table[index.reshape(-1)].T
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+
+tariff_book = TariffBook()
+
+
+@event.listens_for(Tariff, 'after_insert')
+@event.listens_for(Tariff, 'after_update')
+@event.listens_for(Tariff, 'after_delete')
+def _tariff_changed(mapper, connection, target):
+    tariff_book.invalidate()
+    on_commit(object_session(target), lambda: get_backend().publish(INVALIDATION_CHANNEL, ''))
+
+
+@subscriber(INVALIDATION_CHANNEL)
+def _tariffs_changed_elsewhere(message):
+    tariff_book.invalidate()
+
+
+def quote(weight, number_of_bags, trolley_required, station=None):
+    """Price a single booking"""
+    rule = tariff_book.rule_for(station)
+    total = weight * rule.per_kg + number_of_bags * rule.per_bag
+    if trolley_required:
+        total += rule.trolley_fee
+    return max(total, rule.minimum_charge)
+
+
+def quote_many(stations, weights, numbers_of_bags, trolleys_required):
+    """Price many bookings at once.
+
+    Each argument is an array-like of equal length; `stations` may also be a
+    single station (or None) shared by every item. Returns a float array.
+    """
+    # Only bulk quotes need NumPy, so workers do not pay for importing it at start-up
+    import numpy as np
+    weights = np.asarray(weights, dtype=float)
+    numbers_of_bags = np.asarray(numbers_of_bags, dtype=float)
+    trolleys_required = np.asarray(trolleys_required, dtype=bool)
+    if stations is None or isinstance(stations, str):
+        stations = [stations or ''] * len(weights)
+    # np.unique cannot sort None alongside strings
+    stations = np.asarray(['' if station is None else station for station in stations], dtype=object)
+
+    per_kg, per_bag, trolley_fee, minimum_charge = tariff_book.rule_arrays(stations)
+    total = weights * per_kg + numbers_of_bags * per_bag + trolleys_required * trolley_fee
+    return np.maximum(total, minimum_charge)
+
+
+def parse_quote_items(items, default_station=None):
+    """Turn a list of quote request dicts into quote_many arguments.
+
+    Raises ValueError if an item is malformed or outside BookingForm's limits.
+    """
+    import numpy as np
+    try:
+        weights = np.array([item['weight'] for item in items], dtype=float)
+        numbers_of_bags = np.array([item['number_of_bags'] for item in items], dtype=float)
+        trolleys_required = np.array([bool(item.get('trolley_required')) for item in items])
+        stations = [item.get('station', default_station) for item in items]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ValueError('Each item needs a numeric weight and number_of_bags')
+    if not all(station is None or isinstance(station, str) for station in stations):
+        raise ValueError('station must be a string')
+
+    if not (((weights >= 1) & (weights <= 100)).all() and ((numbers_of_bags >= 1) & (numbers_of_bags <= 10)).all()):
+        raise ValueError('weight must be 1-100 kg and number_of_bags 1-10')
+    return stations, weights, numbers_of_bags, trolleys_required
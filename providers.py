@@ -0,0 +1,124 @@
+"""
+Outbound providers for SMS (Twilio) and payments (Stripe)
+
+Provider SDKs are imported and configured on first use, so importing the
+app stays cheap.
+
+Set OUTBOUND_PROVIDERS=fake to swap both for in-process fakes, e.g. to
+load-test the booking flow offline. FAKE_PROVIDER_LATENCY_MS and
+FAKE_PROVIDER_FAILURE_RATE shape how the fakes behave.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from instrumentation import track_external
+
+
+class TwilioSMSProvider:
+    def __init__(self):
+        from twilio.rest import Client
+        self.client = Client(os.environ.get('TWILIO_ACCOUNT_SID'), os.environ.get('TWILIO_AUTH_TOKEN'))
+        self.from_number = os.environ.get('TWILIO_PHONE_NUMBER')
+
+    def send(self, to, body):
+        with track_external('twilio'):
+            return self.client.messages.create(body=body, from_=self.from_number, to=to)
+
+
+class StripeProvider:
+    def __init__(self):
+        import stripe
+        stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+        self.stripe = stripe
+
+    def create_checkout_session(self, amount, success_url, cancel_url, idempotency_key, client_reference_id=None):
+        with track_external('stripe'):
+            return self.stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[{
+                    'price_data': {
+                        'currency': 'inr',
+                        'unit_amount': int(amount * 100),
+                        'product_data': {
+                            'name': 'Porter Service',
+                        },
+                    },
+                    'quantity': 1,
+                }],
+                mode='payment',
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=client_reference_id,
+                idempotency_key=idempotency_key,
+            )
+
+
+class FakeProvider:
+    """Records calls in memory with optional latency and failures"""
+
+    def __init__(self, latency_ms=0, failure_rate=0.0):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, name, **kwargs):
+        with track_external(f'fake_{name}'):
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            if self.failure_rate and random.random() < self.failure_rate:
+                raise RuntimeError(f'Fake {name} failure')
+        with self._lock:
+            self.calls.append((name, kwargs))
+
+
+class FakeSMSProvider(FakeProvider):
+    def send(self, to, body):
+        self._call('sms', to=to, body=body)
+        return SimpleNamespace(sid=f'SM{uuid.uuid4().hex}')
+
+
+class FakeStripeProvider(FakeProvider):
+    def create_checkout_session(self, amount, success_url, cancel_url, idempotency_key, client_reference_id=None):
+        self._call('checkout', amount=amount, idempotency_key=idempotency_key, client_reference_id=client_reference_id)
+        # Stripe returns the original session for a repeated idempotency key
+        return SimpleNamespace(id=f'cs_fake_{idempotency_key}', url=success_url)
+
+
+_providers = {}
+_lock = threading.Lock()
+
+
+def _use_fakes():
+    return os.environ.get('OUTBOUND_PROVIDERS') == 'fake'
+
+
+def _fake_options():
+    return {
+        'latency_ms': float(os.environ.get('FAKE_PROVIDER_LATENCY_MS', 0)),
+        'failure_rate': float(os.environ.get('FAKE_PROVIDER_FAILURE_RATE', 0)),
+    }
+
+
+def _get(name, live, fake):
+    with _lock:
+        if name not in _providers:
+            _providers[name] = fake(**_fake_options()) if _use_fakes() else live()
+        return _providers[name]
+
+
+def get_sms_provider():
+    return _get('sms', TwilioSMSProvider, FakeSMSProvider)
+
+
+def get_payment_provider():
+    return _get('payment', StripeProvider, FakeStripeProvider)
+
+
+def set_provider(name, provider):
+    """Override the 'sms' or 'payment' provider, e.g. with a fake in a benchmark"""
+    with _lock:
+        _providers[name] = provider
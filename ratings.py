@@ -0,0 +1,77 @@
+"""
+Porter rating aggregates
+
+Ratings are folded into porter.rating_sum/total_ratings with a single
+UPDATE, so concurrent ratings for the same porter never overwrite each
+other. reconcile() recomputes the aggregates from the rating table and its
+archive.
+"""
+from sqlalchemy import Integer, cast, func, select, update
+from app import db
+from models import ArchivedRating, Porter, Rating
+
+
+def add_porter_rating(porter_id, value):
+    """Fold one rating into a porter's aggregates atomically"""
+    total_ratings = func.coalesce(Porter.total_ratings, 0)
+    # Porters rated before rating_sum existed only have the average to go on
+    rating_sum = func.coalesce(
+        Porter.rating_sum,
+        cast(func.round(func.coalesce(Porter.rating, 0) * total_ratings), Integer)
+    )
+    db.session.execute(
+        update(Porter)
+        .where(Porter.id == porter_id)
+        .values(
+            rating_sum=rating_sum + value,
+            total_ratings=total_ratings + 1,
+            rating=(rating_sum + value) * 1.0 / (total_ratings + 1)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reconcile(batch_size=1000):
+    """Recompute every porter's aggregates from all their ratings, a batch of porters at a time.
+
+    Returns the number of porters whose aggregates were wrong.
+    """
+    last_id = 0
+    fixed = 0
+    while True:
+        porters = db.session.execute(
+            select(Porter.id, Porter.rating_sum, Porter.total_ratings)
+            .where(Porter.id > last_id)
+            .order_by(Porter.id)
+            .limit(batch_size)
+        ).all()
+        if not porters:
+            return fixed
+
+        porter_ids = [porter.id for porter in porters]
+        totals = {}
+        for model in (Rating, ArchivedRating):
+            for porter_id, rating_sum, count in db.session.execute(
+                select(model.porter_id, func.sum(model.rating), func.count(model.id))
+                .where(model.porter_id.in_(porter_ids))
+                .group_by(model.porter_id)
+            ):
+                previous_sum, previous_count = totals.get(porter_id, (0, 0))
+                totals[porter_id] = (previous_sum + rating_sum, previous_count + count)
+
+        updates = []
+        for porter in porters:
+            rating_sum, count = totals.get(porter.id, (0, 0))
+            if (porter.rating_sum, porter.total_ratings) != (rating_sum, count):
+                updates.append({
+                    'id': porter.id,
+                    'rating_sum': rating_sum,
+                    'total_ratings': count,
+                    'rating': rating_sum / count if count else 0.0,
+                })
+        if updates:
+            db.session.execute(update(Porter), updates)
+        db.session.commit()
+
+        fixed += len(updates)
+        last_id = porter_ids[-1]
@@ -0,0 +1,27 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask_login import login_required, current_user
+from database import read_replica
+from dashboard import parse_filters, booking_page, porter_page, summary
+
+bp = Blueprint('admin', __name__)
+
+@bp.route('/admin/dashboard')
+@login_required
+@read_replica
+def admin_dashboard():
+    if current_user.role != 'admin':
+        flash('Access denied')
+        return redirect(url_for('booking.index'))
+    
+    filters = parse_filters(request.args)
+    bookings, next_booking_cursor = booking_page(filters, before=request.args.get('before'))
+    porters, next_porter_cursor = porter_page(filters, after=request.args.get('porters_after'))
+    return render_template(
+        'admin/dashboard.html',
+        bookings=bookings,
+        porters=porters,
+        summary=summary(filters),
+        filters=request.args,
+        next_booking_cursor=next_booking_cursor,
+        next_porter_cursor=next_porter_cursor
+    )
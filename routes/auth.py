@@ -0,0 +1,61 @@
+from flask import Blueprint, render_template, redirect, url_for, flash
+from flask_login import login_user
+from app import db
+from models import User, Porter
+from forms import LoginForm, RegistrationForm
+from passwords import PasswordHasherBusy
+
+bp = Blueprint('auth', __name__)
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('Too many people are signing in right now. Please try again in a moment.')
+            return render_template('auth/login.html', form=form), 503, {'Retry-After': '1'}
+        if valid:
+            # Move the stored hash to the current hashing policy while the password is at hand
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except PasswordHasherBusy:
+                    # Not worth failing the login over; it is retried next time
+                    pass
+            login_user(user)
+            return redirect(url_for('booking.index'))
+        flash('Invalid email or password')
+    return render_template('auth/login.html', form=form)
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        user = User(
+            username=form.username.data,
+            email=form.email.data,
+            phone=form.phone.data,
+            role=form.role.data
+        )
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('Too many people are signing in right now. Please try again in a moment.')
+            return render_template('auth/register.html', form=form), 503, {'Retry-After': '1'}
+        db.session.add(user)
+        
+        if form.role.data == 'porter':
+            porter = Porter(
+                user_id=user.id,
+                badge_number=f"P{user.id:05d}"
+            )
+            db.session.add(porter)
+            
+        db.session.commit()
+        flash('Registration successful')
+        return redirect(url_for('auth.login'))
+    return render_template('auth/register.html', form=form)
@@ -0,0 +1,307 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, abort, send_file
+from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from app import db
+import json
+import os
+import threading
+import time
+from models import Booking, Rating
+from forms import BookingForm, RatingForm
+from utils import calculate_price, generate_otp, verify_otp, rate_limited
+from dispatch import claim_porter, available_slots, SLOT_MINUTES, MAX_LOOKAHEAD_HOURS
+from jobs import enqueue_booking_jobs, enqueue_otp_sms
+from otp_cache import remember_otp, forget_otp
+from stats import record_booking, transition, record_rating
+from ratings import add_porter_rating
+from pricing import quote_many, parse_quote_items
+from events import publish_status, status_message, subscribe, TERMINAL_STATUSES
+from page_cache import cached_page, booking_version, invalidate_booking
+from passes import booking_pass
+from datetime import datetime, timedelta
+
+bp = Blueprint('booking', __name__)
+
+MAX_QUOTE_ITEMS = 1000
+
+# Per-user limits on OTP endpoints: (calls, seconds)
+VERIFY_OTP_LIMIT = (5, 60)
+RESEND_OTP_LIMIT = (3, 600)
+
+# Live tracking
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 30 * 60  # clients reconnect after this
+SSE_RETRY_MS = 3000
+LONG_POLL_SECONDS = 25
+# Event streams and long polls waiting at once per process. Each holds a
+# request thread, so keep this well under gunicorn's --threads; beyond it
+# streams answer 503 and long polls return straight away.
+MAX_TRACKING_WAITS = int(os.environ.get('MAX_TRACKING_WAITS', 20))
+_tracking_waits = threading.BoundedSemaphore(MAX_TRACKING_WAITS)
+
+@bp.route('/')
+def index():
+    return cached_page('index.html', lambda: render_template('index.html'))
+
+@bp.route('/booking/new', methods=['GET', 'POST'])
+@login_required
+def new_booking():
+    form = BookingForm()
+    if form.validate_on_submit():
+        # Calculate price
+        total_amount = calculate_price(
+            form.weight.data,
+            form.number_of_bags.data,
+            form.trolley_required.data,
+            station=form.station.data
+        )
+        
+        # Reserve a porter free at the station for the meeting time; the reservation commits with the booking
+        claim = claim_porter(form.station.data, form.meeting_time.data)
+        if claim is None:
+            flash('No porters are free at this station at that time. Please pick another time.')
+            return redirect(url_for('booking.new_booking'))
+        porter, slots = claim
+        
+        # Generate OTP
+        otp = generate_otp()
+        
+        # Create booking
+        booking = Booking(
+            user_id=current_user.id,
+            porter_id=porter.id,
+            station=porter.station,
+            weight=form.weight.data,
+            trolley_required=form.trolley_required.data,
+            number_of_bags=form.number_of_bags.data,
+            price=total_amount,
+            otp=otp,
+            otp_expiry=form.meeting_time.data + timedelta(minutes=30),  # OTP valid for 30 minutes after meeting time
+            meeting_point=form.meeting_point.data,
+            meeting_time=form.meeting_time.data,
+            slots=slots
+        )
+        db.session.add(booking)
+        db.session.flush()
+        record_booking(booking)
+        
+        # The Stripe checkout session and OTP SMS are sent by the worker
+        sms_queued = enqueue_booking_jobs(booking, phone=current_user.phone, host_url=request.host_url)
+        db.session.commit()
+        remember_otp(booking)
+        
+        if sms_queued:
+            flash('Booking confirmed! You will receive an SMS shortly with the OTP to share with the porter.')
+        else:
+            # Accounts made before phone numbers were collected
+            flash('Booking confirmed! Your account has no phone number, so download your pass for the OTP to share with the porter.')
+        return redirect(url_for('booking.track_booking', booking_id=booking.id))
+            
+    return render_template('booking/new.html', form=form)
+
+@bp.route('/api/quotes', methods=['POST'])
+@login_required
+def bulk_quote():
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    if len(items) > MAX_QUOTE_ITEMS:
+        return jsonify({'error': f'At most {MAX_QUOTE_ITEMS} items can be quoted at once'}), 400
+    
+    try:
+        stations, weights, numbers_of_bags, trolleys_required = parse_quote_items(items, data.get('station'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    prices = quote_many(stations, weights, numbers_of_bags, trolleys_required)
+    return jsonify({'quotes': prices.round(2).tolist(), 'total': round(float(prices.sum()), 2)})
+
+@bp.route('/api/stations/<station>/slots')
+@login_required
+def station_slots(station):
+    """Free porters per meeting slot over the next ?hours= hours"""
+    hours = min(max(request.args.get('hours', 12, type=int), 1), MAX_LOOKAHEAD_HOURS)
+    return jsonify({
+        'station': station,
+        'slot_minutes': SLOT_MINUTES,
+        'slots': [
+            {'start': start.isoformat(), 'available': free}
+            for start, free in available_slots(station, hours)
+        ],
+    })
+
+@bp.route('/booking/<int:booking_id>/track')
+@login_required
+def track_booking(booking_id):
+    # A cached page needs no queries at all; the booking is only loaded to render it
+    return cached_page(
+        f'booking/tracking.html:{booking_id}',
+        lambda: render_template('booking/tracking.html', booking=Booking.query.get_or_404(booking_id)),
+        version=booking_version(booking_id)
+    )
+
+@bp.route('/booking/<int:booking_id>/pass.pdf')
+@login_required
+def booking_pass_pdf(booking_id):
+    path = booking_pass(booking_id, user_id=None if current_user.role == 'admin' else current_user.id)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype='application/pdf',
+                     download_name=f'porterpro-pass-{booking_id}.pdf')
+
+def _can_track(booking):
+    return booking.user_id == current_user.id or current_user.role == 'admin'
+
+@bp.route('/booking/<int:booking_id>/events')
+@login_required
+def booking_events(booking_id):
+    """Server-sent events stream of a booking's status changes"""
+    booking = Booking.query.get_or_404(booking_id)
+    if not _can_track(booking):
+        return jsonify({'error': 'Access denied'}), 403
+    if not _tracking_waits.acquire(blocking=False):
+        # The client falls back to the long-poll endpoint
+        return jsonify({'error': 'Too many live tracking streams'}), 503, {'Retry-After': str(SSE_RETRY_MS // 1000)}
+    
+    # Subscribe before sending the current status so no change falls in between
+    subscription = subscribe(booking.id)
+    message = status_message(booking)
+    # Idle streams must not hold a database connection
+    db.session.close()
+    
+    def stream():
+        with subscription:
+            yield f"retry: {SSE_RETRY_MS}\n"
+            yield f"data: {json.dumps(message)}\n\n"
+            status = message['status']
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while status not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                status = event['status']
+                yield f"data: {json.dumps(event)}\n\n"
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Also runs if the client leaves before the stream starts
+    response.call_on_close(_tracking_waits.release)
+    return response
+
+@bp.route('/booking/<int:booking_id>/status')
+@login_required
+def booking_status(booking_id):
+    """Long poll: returns once the status differs from ?since= or the wait times out"""
+    booking = Booking.query.get_or_404(booking_id)
+    if not _can_track(booking):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    since = request.args.get('since')
+    timeout = min(request.args.get('timeout', LONG_POLL_SECONDS, type=float), LONG_POLL_SECONDS)
+    with subscribe(booking.id) as subscription:
+        message = status_message(booking)
+        db.session.close()
+        # With too many requests already waiting, answer at once and let the client poll again
+        if message['status'] == since and timeout > 0 and _tracking_waits.acquire(blocking=False):
+            try:
+                message = subscription.get(timeout=timeout) or message
+            finally:
+                _tracking_waits.release()
+    
+    return jsonify(dict(message, changed=message['status'] != since))
+
+@bp.route('/booking/<int:booking_id>/rate', methods=['POST'])
+@login_required
+def rate_booking(booking_id):
+    form = RatingForm()
+    if form.validate_on_submit():
+        booking = Booking.query.get_or_404(booking_id)
+        if booking.user_id != current_user.id:
+            flash('You can only rate your own bookings')
+            return redirect(url_for('booking.index'))
+        if booking.rating is not None:
+            flash('This booking has already been rated')
+            return redirect(url_for('booking.index'))
+        
+        rating = Rating(
+            booking_id=booking.id,
+            porter_id=booking.porter_id,
+            user_id=current_user.id,
+            rating=form.rating.data,
+            comment=form.comment.data
+        )
+        db.session.add(rating)
+        try:
+            # A rating posted at the same moment fails here, on the unique booking_id
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            flash('This booking has already been rated')
+            return redirect(url_for('booking.index'))
+        record_rating(booking, form.rating.data)
+        
+        # Update porter rating last, so its row lock is held only until the commit
+        add_porter_rating(booking.porter_id, form.rating.data)
+        
+        db.session.commit()
+        invalidate_booking(booking.id)
+        flash('Thank you for your rating')
+    return redirect(url_for('booking.index'))
+
+@bp.route('/booking/<int:booking_id>/verify-otp', methods=['POST'])
+@login_required
+@rate_limited('verify_otp', *VERIFY_OTP_LIMIT)
+def verify_booking_otp(booking_id):
+    booking = Booking.query.get_or_404(booking_id)
+    
+    # Check if booking belongs to current user
+    if booking.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Check if OTP has expired
+    if datetime.utcnow() > booking.otp_expiry:
+        return jsonify({'error': 'OTP has expired'}), 400
+    
+    otp = request.json.get('otp')
+    if not otp:
+        return jsonify({'error': 'OTP is required'}), 400
+    
+    if verify_otp(booking, otp):
+        booking.otp_verified = True
+        transition(booking, 'in_progress')
+        db.session.commit()
+        forget_otp(booking)
+        publish_status(booking)
+        return jsonify({'message': 'OTP verified successfully'})
+    else:
+        return jsonify({'error': 'Invalid OTP'}), 400
+
+@bp.route('/booking/<int:booking_id>/resend-otp')
+@login_required
+@rate_limited('resend_otp', *RESEND_OTP_LIMIT)
+def resend_booking_otp(booking_id):
+    booking = Booking.query.get_or_404(booking_id)
+    
+    # Check if booking belongs to current user
+    if booking.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not current_user.phone:
+        return jsonify({'error': 'Your account has no phone number to send the OTP to'}), 400
+    
+    # Generate new OTP
+    forget_otp(booking)
+    otp = generate_otp()
+    booking.otp = otp
+    booking.otp_expiry = booking.meeting_time + timedelta(minutes=30)
+    
+    # Queue the new OTP for the worker to send
+    enqueue_otp_sms(booking, current_user.phone)
+    db.session.commit()
+    remember_otp(booking)
+    invalidate_booking(booking.id)
+    return jsonify({'message': 'OTP will be sent shortly'})
@@ -0,0 +1,75 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app import db
+from models import Booking
+from utils import porter_required, rate_limited
+from dispatch import mark_busy, release_porter, release_slots
+from otp_cache import forget_otp, find_pending_booking
+from stats import transition
+from events import publish_status
+from datetime import datetime
+
+bp = Blueprint('porter', __name__)
+
+# Per-porter limit on OTP attempts: (calls, seconds)
+VERIFY_OTP_LIMIT = (20, 60)
+
+@bp.route('/porter/verify-otp', methods=['POST'])
+@login_required
+@porter_required
+@rate_limited('porter_verify_otp', *VERIFY_OTP_LIMIT)
+def porter_verify_otp():
+    otp = request.json.get('otp')
+    if not otp:
+        return jsonify({'error': 'OTP is required'}), 400
+    
+    # Find the booking assigned to this porter with this OTP
+    booking = find_pending_booking(current_user.porter.id, otp)
+    
+    if not booking:
+        return jsonify({'error': 'Invalid or expired OTP'}), 400
+    
+    # Check if OTP has expired
+    if datetime.utcnow() > booking.otp_expiry:
+        return jsonify({'error': 'OTP has expired'}), 400
+    
+    # Verify the OTP
+    booking.otp_verified = True
+    transition(booking, 'in_progress')
+    mark_busy(booking.porter)
+    db.session.commit()
+    forget_otp(booking)
+    publish_status(booking)
+    
+    return jsonify({
+        'message': 'OTP verified successfully',
+        'booking_id': booking.id,
+        'customer_name': booking.user.username,
+        'meeting_point': booking.meeting_point,
+        'weight': booking.weight,
+        'trolley_required': booking.trolley_required,
+        'number_of_bags': booking.number_of_bags
+    })
+
+@bp.route('/porter/complete-booking/<int:booking_id>', methods=['POST'])
+@login_required
+@porter_required
+def porter_complete_booking(booking_id):
+    booking = Booking.query.get_or_404(booking_id)
+    
+    # Check if the porter owns this booking
+    if booking.porter_id != current_user.porter.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Check if the booking is in progress
+    if booking.status != 'in_progress':
+        return jsonify({'error': 'Invalid booking status'}), 400
+    
+    # Complete the booking
+    transition(booking, 'completed')
+    release_porter(booking.porter)
+    release_slots(booking)
+    db.session.commit()
+    publish_status(booking)
+    
+    return jsonify({'message': 'Booking completed successfully'})
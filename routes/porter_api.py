@@ -0,0 +1,35 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from utils import porter_required, rate_limited
+from dispatch import MAX_LOOKAHEAD_HOURS
+from porter_queue import QUEUE_HOURS, porter_queue, apply_status_updates
+from routes.porter import VERIFY_OTP_LIMIT
+
+# Versioned JSON API for porter handhelds; responses keep their shape within a version
+bp = Blueprint('porter_api', __name__, url_prefix='/api/v1/porter')
+
+@bp.route('/queue')
+@login_required
+@porter_required
+def queue():
+    """The porter's open bookings; send If-None-Match to get 304 when nothing changed"""
+    # Whole hours, as for the station slots endpoint: nan and inf cannot get through
+    hours = min(max(request.args.get('hours', QUEUE_HOURS, type=int), 1), MAX_LOOKAHEAD_HOURS)
+    response = jsonify({'bookings': porter_queue(current_user.porter.id, hours)})
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@bp.route('/bookings/status', methods=['POST'])
+@login_required
+@porter_required
+@rate_limited('porter_verify_otp', *VERIFY_OTP_LIMIT)
+def update_statuses():
+    """Apply a batch of {'id', 'status', 'otp'} updates; see porter_queue.apply_status_updates"""
+    payload = request.get_json(silent=True)
+    updates = payload.get('updates') if isinstance(payload, dict) else None
+    try:
+        results = apply_status_updates(current_user.porter.id, updates)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'results': results})
@@ -0,0 +1,17 @@
+from flask import Blueprint, request, jsonify
+from app import db
+import webhooks
+
+bp = Blueprint('webhooks', __name__)
+
+@bp.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    try:
+        event = webhooks.parse_event(request.get_data(), request.headers.get('Stripe-Signature'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Store and acknowledge; the worker applies payment status in batches
+    webhooks.record_event(event)
+    db.session.commit()
+    return jsonify({'received': True})
@@ -0,0 +1,107 @@
+"""
+Schema upgrades for databases created by an earlier release
+
+db.create_all() creates missing tables but never changes existing ones.
+upgrade() also adds the columns and indexes the models have gained since a
+table was created, and fills the new columns of existing rows. It only
+ever adds, so it is safe to run on every deploy; see the README for the
+commands to run after it when upgrading.
+"""
+import logging
+from sqlalchemy import Integer, cast, func, inspect, select, update
+from app import db
+from models import Booking, Porter
+
+logger = logging.getLogger(__name__)
+
+
+def _backfill_booking_station(connection):
+    # Bookings made before booking.station existed were at their porter's station
+    connection.execute(
+        update(Booking.__table__)
+        .where(Booking.station.is_(None))
+        .values(station=select(Porter.station).where(Porter.id == Booking.porter_id).scalar_subquery())
+    )
+
+
+def _backfill_rating_sum(connection):
+    # Ratings were only kept as an average before rating_sum existed
+    connection.execute(
+        update(Porter.__table__)
+        .where(Porter.rating_sum.is_(None))
+        .values(rating_sum=cast(
+            func.round(func.coalesce(Porter.rating, 0) * func.coalesce(Porter.total_ratings, 0)), Integer
+        ))
+    )
+
+
+# Run once a column is added, to fill it in for existing rows
+BACKFILLS = {
+    ('booking', 'station'): _backfill_booking_station,
+    ('porter', 'rating_sum'): _backfill_rating_sum,
+}
+
+
+def _add_column(connection, table, column):
+    if not column.nullable and column.server_default is None:
+        raise RuntimeError(f'Cannot add required column {table.name}.{column.name} to existing rows')
+    preparer = connection.dialect.identifier_preparer
+    connection.exec_driver_sql(
+        f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} '
+        f'{column.type.compile(dialect=connection.dialect)}'
+    )
+
+
+def _has_duplicates(connection, index):
+    """Whether existing rows would violate `index` were it unique"""
+    columns = list(index.columns)
+    return connection.execute(
+        select(*columns)
+        .where(*(column.is_not(None) for column in columns))
+        .group_by(*columns)
+        .having(func.count() > 1)
+        .limit(1)
+    ).first() is not None
+
+
+def upgrade():
+    """Bring the database up to the models.
+
+    Returns {'tables': [...], 'columns': [...], 'indexes': [...], 'skipped': [...]},
+    where skipped lists unique indexes the existing rows violate.
+    """
+    changes = {'tables': [], 'columns': [], 'indexes': [], 'skipped': []}
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes['tables'].append(table.name)
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    _add_column(connection, table, column)
+                    changes['columns'].append(f'{table.name}.{column.name}')
+                    backfill = BACKFILLS.get((table.name, column.name))
+                    if backfill is not None:
+                        backfill(connection)
+
+            existing_indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                current = existing_indexes.get(index.name)
+                if current is not None and bool(current['unique']) == bool(index.unique):
+                    continue
+                if index.unique and _has_duplicates(connection, index):
+                    logger.warning('Existing rows violate unique index %s; it was left as it is', index.name)
+                    changes['skipped'].append(index.name)
+                    continue
+                if current is not None:
+                    # An index made unique since it was created
+                    index.drop(connection)
+                index.create(connection)
+                changes['indexes'].append(index.name)
+    return changes
@@ -0,0 +1,108 @@
+"""
+Fingerprinted, pre-compressed static assets
+
+`python commands.py build_static` copies every file in the static folder to
+static/dist under a name containing a hash of its content, writes a gzip
+copy next to each compressible one, and records the names in
+static/dist/manifest.json. When the manifest exists, url_for('static', ...)
+points at the fingerprinted copy, which is served with a year-long
+immutable Cache-Control header and, for clients accepting gzip, from the
+pre-compressed file. Without a build, static files are served as Flask
+normally does.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+FINGERPRINT_LENGTH = 12
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+# Skip compressing files this small; headers would outweigh the saving
+MIN_COMPRESS_SIZE = 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _fingerprinted(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest[:FINGERPRINT_LENGTH]}{ext}'
+
+
+def build(static_folder):
+    """Fingerprint and compress every asset in `static_folder`; returns the manifest"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for directory, subdirectories, files in os.walk(static_folder):
+        subdirectories[:] = [name for name in subdirectories if os.path.join(directory, name) != dist]
+        for name in sorted(files):
+            source = os.path.join(directory, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            target = f'{DIST_DIR}/{_fingerprinted(logical, hashlib.sha256(content).hexdigest())}'
+
+            path = os.path.join(static_folder, *target.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            if name.lower().endswith(COMPRESSIBLE) and len(content) >= MIN_COMPRESS_SIZE:
+                compressed = gzip.compress(content, compresslevel=9, mtime=0)
+                if len(compressed) < len(content):
+                    with open(path + '.gz', 'wb') as f:
+                        f.write(compressed)
+            manifest[logical] = target
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _asset_url_defaults(endpoint, values):
+    if endpoint == 'static':
+        manifest = current_app.extensions['static_assets']
+        filename = values.get('filename')
+        if filename in manifest:
+            values['filename'] = manifest[filename]
+
+
+def _serve_static(filename):
+    app = current_app
+    if not filename.startswith(DIST_DIR + '/'):
+        return app.send_static_file(filename)
+
+    gzipped = f'{filename}.gz'
+    gzipped_path = safe_join(app.static_folder, gzipped)
+    if 'gzip' in request.accept_encodings and gzipped_path and os.path.isfile(gzipped_path):
+        # Named after the asset itself, so the content type is the asset's
+        response = send_from_directory(app.static_folder, gzipped, download_name=os.path.basename(filename))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(app.static_folder, filename)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Serve fingerprinted assets if `build_static` has been run"""
+    if not app.has_static_folder:
+        return
+    app.extensions['static_assets'] = load_manifest(app.static_folder)
+    app.url_defaults(_asset_url_defaults)
+    app.view_functions['static'] = _serve_static
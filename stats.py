@@ -0,0 +1,144 @@
+"""
+Per station/day/status booking rollup
+
+Routes call record_booking, transition and record_rating in the same
+transaction as the booking change, so booking_stat always matches the
+booking table; archiving a booking leaves its totals in place. rebuild()
+recreates it from scratch in chunks.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from app import db
+from database import upsert_insert
+from models import ArchivedBooking, ArchivedRating, Booking, BookingStat, Rating
+
+TOTALS = ('booking_count', 'price_total', 'weight_total', 'rating_total', 'rating_count')
+
+
+def _add(rows):
+    """Add each row's totals onto its (station, day, status) bucket"""
+    if not rows:
+        return
+    stmt = upsert_insert(BookingStat).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['station', 'day', 'status'],
+        set_={total: getattr(BookingStat, total) + getattr(stmt.excluded, total) for total in TOTALS}
+    ))
+
+
+def _bucket(booking, status, sign=1, rating=None):
+    booking_time = booking.booking_time or datetime.utcnow()
+    row = {
+        'station': booking.station or '',
+        'day': booking_time.date(),
+        'status': status,
+        'booking_count': sign,
+        'price_total': sign * booking.price,
+        'weight_total': sign * booking.weight,
+        'rating_total': 0,
+        'rating_count': 0,
+    }
+    if rating is not None:
+        row['rating_total'] = sign * rating
+        row['rating_count'] = sign
+    return row
+
+
+def record_booking(booking):
+    """Count a newly created booking; call after it has been flushed"""
+    _add([_bucket(booking, booking.status or 'pending')])
+
+
+def transition(booking, status):
+    """Move a booking to a new status and its totals to the new bucket"""
+    old_status = booking.status
+    if old_status == status:
+        return
+    rating = booking.rating.rating if booking.rating else None
+    booking.status = status
+    _add([
+        _bucket(booking, old_status, sign=-1, rating=rating),
+        _bucket(booking, status, rating=rating),
+    ])
+
+
+def transition_many(bookings, old_status, status):
+    """Move totals for bookings already switched from old_status to status by a bulk UPDATE.
+
+    Each booking needs station, booking_time, price, weight and rating
+    (the rating value or None) attributes.
+    """
+    # Postgres rejects an upsert that touches the same bucket twice, so merge first
+    buckets = defaultdict(lambda: dict.fromkeys(TOTALS, 0))
+    for booking in bookings:
+        for row in (_bucket(booking, old_status, sign=-1, rating=booking.rating),
+                    _bucket(booking, status, rating=booking.rating)):
+            totals = buckets[(row['station'], row['day'], row['status'])]
+            for total in TOTALS:
+                totals[total] += row[total]
+    _add([
+        dict(totals, station=station, day=day, status=bucket_status)
+        for (station, day, bucket_status), totals in buckets.items()
+    ])
+
+
+def record_rating(booking, rating):
+    """Count a rating against the booking's current bucket"""
+    row = _bucket(booking, booking.status, rating=rating)
+    row['booking_count'] = 0
+    row['price_total'] = 0.0
+    row['weight_total'] = 0.0
+    _add([row])
+
+
+def _count_chunks(booking_model, rating_model, chunk_size):
+    station = func.coalesce(booking_model.station, '')
+    day = func.date(booking_model.booking_time, type_=db.Date)
+    status = func.coalesce(booking_model.status, 'pending')
+    last_id = 0
+    counted = 0
+    while True:
+        chunk_end = db.session.execute(
+            select(booking_model.id).where(booking_model.id > last_id).order_by(booking_model.id)
+            .offset(chunk_size - 1).limit(1)
+        ).scalar()
+        in_chunk = [booking_model.id > last_id]
+        if chunk_end is not None:
+            in_chunk.append(booking_model.id <= chunk_end)
+
+        rows = db.session.execute(
+            select(
+                station.label('station'),
+                day.label('day'),
+                status.label('status'),
+                func.count(booking_model.id).label('booking_count'),
+                func.sum(booking_model.price).label('price_total'),
+                func.sum(booking_model.weight).label('weight_total'),
+                func.coalesce(func.sum(rating_model.rating), 0).label('rating_total'),
+                func.count(rating_model.id).label('rating_count'),
+            )
+            .outerjoin(rating_model, rating_model.booking_id == booking_model.id)
+            .where(*in_chunk)
+            .group_by(station, day, status)
+        ).mappings().all()
+        _add([dict(row) for row in rows])
+        db.session.commit()
+        counted += sum(row['booking_count'] for row in rows)
+
+        if chunk_end is None:
+            return counted
+        last_id = chunk_end
+
+
+def rebuild(chunk_size=1000):
+    """Recreate booking_stat from the booking and rating tables and their archives, chunk by chunk.
+
+    Bookings changed while this runs may be counted twice, so run it when the
+    site is quiet. Returns the number of bookings counted.
+    """
+    db.session.execute(delete(BookingStat))
+    return (
+        _count_chunks(Booking, Rating, chunk_size)
+        + _count_chunks(ArchivedBooking, ArchivedRating, chunk_size)
+    )
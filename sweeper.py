@@ -0,0 +1,203 @@
+"""
+Housekeeping for bookings, porters, the job queue and webhook events
+
+sweep() runs each step as set-based UPDATE or DELETE statements over
+bounded batches, committing after every batch so no step holds locks for
+long:
+
+- pending bookings lose their OTP once it has expired
+- pending bookings still unverified STALE_AFTER past OTP expiry are cancelled
+- in-progress bookings ABANDONED_AFTER past their meeting time are completed
+- porters marked busy without an in-progress booking are freed
+- porter slot reservations older than SLOT_RETENTION are deleted
+- finished jobs older than JOB_RETENTION are deleted
+- applied Stripe events older than WEBHOOK_EVENT_RETENTION are deleted
+
+Run it from cron with `python commands.py sweep`, or in-process with
+`python worker.py --sweep-interval 60`.
+"""
+import logging
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import delete, exists, func, select, update
+from app import db
+from models import Booking, Job, Porter, PorterSlot, Rating, StripeEvent
+from events import publish_status
+import stats
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# How long after its OTP expires an unverified booking is kept before it is cancelled
+STALE_AFTER = timedelta(hours=2)
+# How long after the meeting time a porter who never marked the booking complete is held
+ABANDONED_AFTER = timedelta(hours=12)
+SLOT_RETENTION = timedelta(days=1)
+JOB_RETENTION = timedelta(days=7)
+# Stored events dedupe Stripe's retries, which stop three days after the first delivery
+WEBHOOK_EVENT_RETENTION = timedelta(days=7)
+
+
+def _due(query, batch_size):
+    """Limit a select of ids to one batch, skipping rows locked by requests on Postgres"""
+    query = query.limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    return query.scalar_subquery()
+
+
+def _in_batches(step, batch_size):
+    """Run step(batch_size), committing after each batch, until a batch comes up short"""
+    total = 0
+    while True:
+        changed = step(batch_size)
+        db.session.commit()
+        total += changed
+        if changed < batch_size:
+            return total
+
+
+def _update_bookings(conditions, values, batch_size):
+    """Apply `values` to one batch of bookings matching `conditions` and return the changed rows"""
+    return db.session.execute(
+        update(Booking)
+        .where(Booking.id.in_(_due(select(Booking.id).where(*conditions), batch_size)), *conditions)
+        .values(**values)
+        .returning(Booking.id, Booking.status, Booking.otp_verified, Booking.station,
+                   Booking.booking_time, Booking.price, Booking.weight)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _move_stats(rows, old_status, status):
+    ratings = dict(db.session.execute(
+        select(Rating.booking_id, Rating.rating).where(Rating.booking_id.in_([row.id for row in rows]))
+    ).all())
+    stats.transition_many(
+        [SimpleNamespace(**row._asdict(), rating=ratings.get(row.id)) for row in rows],
+        old_status, status
+    )
+
+
+def _transition_batch(conditions, old_status, status, batch_size, extra_values=None):
+    rows = _update_bookings(conditions, dict(extra_values or {}, status=status), batch_size)
+    if rows:
+        _move_stats(rows, old_status, status)
+        db.session.commit()
+        for row in rows:
+            publish_status(row)
+    return len(rows)
+
+
+def expire_otps(now, batch_size=BATCH_SIZE):
+    """Clear expired OTPs from pending bookings so they can no longer be verified"""
+    conditions = [
+        Booking.status == 'pending',
+        Booking.otp_verified.is_(False),
+        Booking.otp.isnot(None),
+        Booking.otp_expiry < now,
+    ]
+    return _in_batches(lambda size: len(_update_bookings(conditions, {'otp': None}, size)), batch_size)
+
+
+def cancel_stale_bookings(now, batch_size=BATCH_SIZE):
+    """Cancel pending bookings nobody verified within STALE_AFTER of OTP expiry"""
+    conditions = [
+        Booking.status == 'pending',
+        Booking.otp_verified.is_(False),
+        func.coalesce(Booking.otp_expiry, Booking.booking_time) < now - STALE_AFTER,
+    ]
+    return _in_batches(
+        lambda size: _transition_batch(conditions, 'pending', 'cancelled', size, {'otp': None}),
+        batch_size
+    )
+
+
+def complete_abandoned_bookings(now, batch_size=BATCH_SIZE):
+    """Complete in-progress bookings the porter never marked complete"""
+    conditions = [
+        Booking.status == 'in_progress',
+        func.coalesce(Booking.meeting_time, Booking.booking_time) < now - ABANDONED_AFTER,
+    ]
+    return _in_batches(
+        lambda size: _transition_batch(conditions, 'in_progress', 'completed', size),
+        batch_size
+    )
+
+
+def free_idle_porters(batch_size=BATCH_SIZE):
+    """Mark porters available again when they have no in-progress booking"""
+    conditions = [
+        Porter.available.is_(False),
+        ~exists().where(Booking.porter_id == Porter.id, Booking.status == 'in_progress'),
+    ]
+
+    def step(size):
+        return db.session.execute(
+            update(Porter)
+            .where(Porter.id.in_(_due(select(Porter.id).where(*conditions), size)), *conditions)
+            .values(available=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return _in_batches(step, batch_size)
+
+
+def purge_past_slots(now, batch_size=BATCH_SIZE):
+    """Delete porter slot reservations that ended more than SLOT_RETENTION ago"""
+    past = PorterSlot.slot_start < now - SLOT_RETENTION
+
+    def step(size):
+        return db.session.execute(
+            delete(PorterSlot)
+            .where(PorterSlot.id.in_(select(PorterSlot.id).where(past).limit(size).scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return _in_batches(step, batch_size)
+
+
+def purge_finished_jobs(now, batch_size=BATCH_SIZE):
+    """Delete completed jobs older than JOB_RETENTION; failed jobs are kept for inspection"""
+    finished = [Job.status == 'done', Job.updated_at < now - JOB_RETENTION]
+
+    def step(size):
+        return db.session.execute(
+            delete(Job)
+            .where(Job.id.in_(select(Job.id).where(*finished).limit(size).scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return _in_batches(step, batch_size)
+
+
+def purge_processed_events(now, batch_size=BATCH_SIZE):
+    """Delete Stripe events applied more than WEBHOOK_EVENT_RETENTION ago"""
+    applied = StripeEvent.processed_at < now - WEBHOOK_EVENT_RETENTION
+
+    def step(size):
+        return db.session.execute(
+            delete(StripeEvent)
+            .where(StripeEvent.id.in_(select(StripeEvent.id).where(applied).limit(size).scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    return _in_batches(step, batch_size)
+
+
+def sweep(now=None, batch_size=BATCH_SIZE):
+    """Run every housekeeping step and return the number of rows each one changed"""
+    now = now or datetime.utcnow()
+    counts = {
+        'cancelled_bookings': cancel_stale_bookings(now, batch_size),
+        'completed_bookings': complete_abandoned_bookings(now, batch_size),
+        'expired_otps': expire_otps(now, batch_size),
+        'freed_porters': free_idle_porters(batch_size),
+        'purged_slots': purge_past_slots(now, batch_size),
+        'purged_jobs': purge_finished_jobs(now, batch_size),
+        'purged_webhook_events': purge_processed_events(now, batch_size),
+    }
+    if any(counts.values()):
+        logger.info('Sweep: %s', ', '.join(f'{name} {count}' for name, count in counts.items()))
+    return counts
+
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules live at the repository root, and app.py configures itself from
+# the environment on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['OUTBOUND_PROVIDERS'] = 'fake'
+
+from app import app as flask_app, db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
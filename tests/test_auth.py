@@ -0,0 +1,31 @@
+import jinja2
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import db
+from models import User
+from passwords import PasswordHasher, PasswordHasherBusy, set_hasher
+
+
+@pytest.fixture
+def login_app(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setattr(app, 'jinja_loader', jinja2.DictLoader({'auth/login.html': 'login', 'index.html': 'index'}))
+    yield app
+    set_hasher(None)
+
+
+def test_login_succeeds_when_rehash_is_busy(login_app):
+    old_hash = generate_password_hash('password1', method='pbkdf2:sha256:1000')
+    db.session.add(User(username='oldhash', email='old@example.com', role='customer', password_hash=old_hash))
+    db.session.commit()
+
+    class BusyForHashing(PasswordHasher):
+        def hash(self, password):
+            raise PasswordHasherBusy('Too many password checks are waiting')
+
+    set_hasher(BusyForHashing(method='pbkdf2:sha256:2000'))
+    response = login_app.test_client().post('/login', data={'email': 'old@example.com', 'password': 'password1'})
+
+    assert response.status_code == 302
+    assert db.session.scalar(db.select(User.password_hash)) == old_hash
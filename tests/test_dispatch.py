@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Porter, PorterSlot, User
+import dispatch
+
+NOW = datetime(2030, 1, 1, 12, 5)
+
+
+@pytest.fixture(autouse=True)
+def clear_slot_index():
+    dispatch.slot_index.clear()
+    yield
+    dispatch.slot_index.clear()
+
+
+def add_porter(name, rating, available=True):
+    user = User(username=name, email=f'{name}@example.com', role='porter')
+    db.session.add(user)
+    db.session.flush()
+    porter = Porter(user_id=user.id, badge_number=name, station='S', rating=rating, available=available)
+    db.session.add(porter)
+    db.session.commit()
+    return porter.id
+
+
+def slot_rows():
+    return db.session.scalars(db.select(PorterSlot).order_by(PorterSlot.porter_id, PorterSlot.slot_start)).all()
+
+
+def test_rollback_hands_slots_back(app):
+    add_porter('alpha', 5.0)
+
+    assert dispatch.claim_porter('S', NOW + timedelta(hours=2), now=NOW) is not None
+    db.session.rollback()
+
+    assert slot_rows() == []
+
+
+def test_taken_porter_falls_through_to_next(app):
+    best = add_porter('alpha', 5.0)
+    other = add_porter('bravo', 4.0)
+    meeting_time = NOW + timedelta(hours=2)
+
+    porter, _ = dispatch.claim_porter('S', meeting_time, now=NOW)
+    db.session.commit()
+    assert porter.id == best
+    # Another worker's index still thinks the best porter is free
+    dispatch.slot_index.clear()
+    dispatch._load_station('S', NOW - timedelta(hours=1))
+    dispatch.slot_index.release('S', best, dispatch.booking_slots(meeting_time))
+
+    porter, _ = dispatch.claim_porter('S', meeting_time, now=NOW)
+    db.session.commit()
+    assert porter.id == other
+    assert dispatch.claim_porter('S', meeting_time, now=NOW) is None
+    assert len(slot_rows()) == 2 * len(dispatch.booking_slots(meeting_time))
+
+
+def test_partly_held_porter_leaves_no_rows(app):
+    held = add_porter('alpha', 5.0)
+    free = add_porter('bravo', 4.0)
+    meeting_time = NOW + timedelta(hours=2, minutes=15)
+    first, second = dispatch.booking_slots(meeting_time)
+    # Reserved by another worker after this one loaded its index
+    dispatch._load_station('S', NOW)
+    db.session.add(PorterSlot(porter_id=held, station='S', slot_start=second))
+    db.session.commit()
+
+    porter, slots = dispatch.claim_porter('S', meeting_time, now=NOW)
+    db.session.commit()
+
+    assert porter.id == free
+    assert [(slot.porter_id, slot.slot_start) for slot in slot_rows()] == [
+        (held, second), (free, first), (free, second)
+    ]
+
+
+def test_porter_on_a_job_is_not_offered_now(app):
+    porter_id = add_porter('alpha', 5.0, available=False)
+
+    assert dispatch.claim_porter('S', NOW, now=NOW) is None
+
+    porter, _ = dispatch.claim_porter('S', NOW + timedelta(hours=2), now=NOW)
+    assert porter.id == porter_id
@@ -0,0 +1,24 @@
+from app import db
+from models import Job, Tariff
+import jobs
+
+
+def test_failed_job_keeps_no_writes_and_others_commit(app, monkeypatch):
+    def add_tariff(payload):
+        db.session.add(Tariff(station=payload['station']))
+        db.session.flush()
+        if payload.get('fail'):
+            raise RuntimeError('provider down')
+
+    monkeypatch.setitem(jobs.HANDLERS, 'add_tariff', add_tariff)
+    jobs.enqueue('add_tariff', 'ok', station='good')
+    jobs.enqueue('add_tariff', 'bad', station='bad', fail=True)
+    jobs.enqueue('add_tariff', 'ok-2', station='also-good')
+    db.session.commit()
+
+    assert jobs.run_batch() == 3
+    db.session.rollback()
+
+    assert sorted(db.session.scalars(db.select(Tariff.station))) == ['also-good', 'good']
+    statuses = dict(db.session.execute(db.select(Job.idempotency_key, Job.status)).all())
+    assert statuses == {'ok': 'done', 'bad': 'pending', 'ok-2': 'done'}
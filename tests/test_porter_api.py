@@ -0,0 +1,25 @@
+import pytest
+
+from app import db
+from models import Porter, User
+
+
+@pytest.fixture
+def porter_client(app):
+    user = User(username='handheld', email='handheld@example.com', role='porter')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Porter(user_id=user.id, badge_number='P1', station='S'))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+@pytest.mark.parametrize('hours', ['nan', 'inf', '-inf', '-3', '0', '1.5', '1000'])
+def test_queue_accepts_any_hours(porter_client, hours):
+    response = porter_client.get(f'/api/v1/porter/queue?hours={hours}')
+
+    assert response.status_code == 200
+    assert response.json == {'bookings': []}
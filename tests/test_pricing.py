@@ -0,0 +1,34 @@
+import pytest
+
+from app import db
+from models import User
+from pricing import parse_quote_items
+
+
+@pytest.mark.parametrize('station', [1, {'name': 'S'}, ['S']])
+def test_non_string_station_is_rejected(station):
+    with pytest.raises(ValueError):
+        parse_quote_items([{'weight': 10, 'number_of_bags': 1, 'station': station}])
+
+
+def test_missing_station_uses_default():
+    items = [{'weight': 10, 'number_of_bags': 1}, {'weight': 5, 'number_of_bags': 2, 'station': None}]
+    stations, *_ = parse_quote_items(items, 'S')
+    assert stations == ['S', None]
+
+
+def test_mixed_stations_get_400(app):
+    user = User(username='quoter', email='q@example.com', role='customer')
+    user.set_password('password1')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    response = client.post('/api/quotes', json={'items': [
+        {'weight': 10, 'number_of_bags': 1, 'station': 1},
+        {'weight': 10, 'number_of_bags': 1, 'station': 'S'},
+    ]})
+
+    assert response.status_code == 400
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import StripeEvent
+import sweeper
+
+
+def stripe_event(id, processed_at):
+    now = datetime(2024, 1, 10)
+    return StripeEvent(id=id, type='checkout.session.completed', created=now - timedelta(days=30),
+                       received_at=now - timedelta(days=30), processed_at=processed_at)
+
+
+def test_only_old_applied_events_are_purged(app):
+    now = datetime(2024, 1, 10)
+    db.session.add_all([
+        stripe_event('evt_old', now - sweeper.WEBHOOK_EVENT_RETENTION - timedelta(hours=1)),
+        stripe_event('evt_recent', now - timedelta(days=1)),
+        stripe_event('evt_pending', None),
+    ])
+    db.session.commit()
+
+    assert sweeper.purge_processed_events(now, batch_size=1) == 1
+
+    assert sorted(db.session.scalars(db.select(StripeEvent.id))) == ['evt_pending', 'evt_recent']
@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+from app import db
+from models import Booking, Porter, User
+from routes import booking as booking_routes
+
+
+@pytest.fixture
+def tracked(app, monkeypatch):
+    monkeypatch.setattr(booking_routes, '_tracking_waits', threading.BoundedSemaphore(1))
+    customer = User(username='tracker', email='tracker@example.com', role='customer')
+    porter_user = User(username='carrier', email='carrier@example.com', role='porter')
+    db.session.add_all([customer, porter_user])
+    db.session.flush()
+    porter = Porter(user_id=porter_user.id, badge_number='P1', station='S')
+    db.session.add(porter)
+    db.session.flush()
+    booking = Booking(user_id=customer.id, porter_id=porter.id, station='S', weight=10, number_of_bags=1, price=100)
+    db.session.add(booking)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(customer.id)
+    return client, booking.id
+
+
+def test_streams_beyond_the_limit_get_503(tracked):
+    client, booking_id = tracked
+
+    first = client.get(f'/booking/{booking_id}/events', buffered=False)
+    assert first.status_code == 200
+    assert client.get(f'/booking/{booking_id}/events').status_code == 503
+    # A long poll still answers, without waiting
+    assert client.get(f'/booking/{booking_id}/status?since=pending&timeout=5').json['changed'] is False
+
+    first.close()
+    second = client.get(f'/booking/{booking_id}/events', buffered=False)
+    assert second.status_code == 200
+    second.close()
@@ -0,0 +1,23 @@
+from app import db
+from backends import get_backend
+from models import User
+import user_cache
+
+
+def test_password_hash_is_not_cached(app):
+    user = User(username='cached', email='cached@example.com', role='customer')
+    user.set_password('password1')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    db.session.remove()
+    user_cache.user_cache.clear()
+
+    user_cache.load_user(user_id)
+    shared = get_backend().get(f'user:{user_id}')
+    db.session.remove()
+    user_cache.user_cache.clear()
+
+    assert 'password_hash' not in shared
+    # A cache hit still reads the hash from the database when it is needed
+    assert user_cache.load_user(user_id).check_password('password1')
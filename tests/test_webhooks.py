@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from app import db
+from models import StripeEvent
+import webhooks
+
+SECRET = 'whsec_test'
+
+
+def signed(event):
+    payload = json.dumps(event).encode()
+    return payload, webhooks.sign(payload, SECRET)
+
+
+def event(data):
+    return {'id': 'evt_1', 'type': 'checkout.session.completed', 'created': 1700000000, 'data': data}
+
+
+@pytest.mark.parametrize('data', [None, 'x', [], {'object': None}, {'object': ['cs_1']}])
+def test_malformed_data_is_rejected(data):
+    payload, header = signed(event(data))
+    with pytest.raises(ValueError):
+        webhooks.parse_event(payload, header, SECRET)
+
+
+def test_malformed_event_gets_400(app, monkeypatch):
+    monkeypatch.setenv('STRIPE_WEBHOOK_SECRET', SECRET)
+    payload, header = signed(event({'object': 'cs_1'}))
+
+    response = app.test_client().post('/stripe/webhook', data=payload, headers={'Stripe-Signature': header})
+
+    assert response.status_code == 400
+
+
+def test_valid_event_is_recorded_once(app, monkeypatch):
+    monkeypatch.setenv('STRIPE_WEBHOOK_SECRET', SECRET)
+    payload, header = signed(event({'object': {'id': 'cs_1', 'client_reference_id': '7', 'payment_status': 'paid'}}))
+    client = app.test_client()
+
+    assert client.post('/stripe/webhook', data=payload, headers={'Stripe-Signature': header}).status_code == 200
+    client.post('/stripe/webhook', data=payload, headers={'Stripe-Signature': header})
+
+    stored = db.session.scalars(db.select(StripeEvent)).all()
+    assert [(row.id, row.booking_id, row.payment_status) for row in stored] == [('evt_1', 7, 'paid')]
@@ -0,0 +1,156 @@
+"""
+Cache behind Flask-Login's user loader
+
+A cache hit rebuilds the User (and, for porters, the Porter) from stored
+column values and attaches it to the request's session without a query.
+The password hash is never cached, and neither are porter columns that
+change with every booking (availability, ratings, location); they load
+from the database when first read.
+
+Snapshots live in a per-process LRU in front of the shared backend. When a
+user or porter changes, the commit drops the shared entry and tells every
+worker to drop its own copy; entries otherwise expire after USER_CACHE_TTL
+seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from models import User, Porter
+from backends import dumps, get_backend, loads, on_commit, subscriber
+
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 300
+INVALIDATION_CHANNEL = 'user_cache:invalidate'
+
+# Password hashes stay out of the cache; they load from the database if ever read
+USER_COLUMNS = tuple(column.key for column in User.__table__.columns if column.key != 'password_hash')
+PORTER_COLUMNS = ('id', 'user_id', 'badge_number', 'station', 'photo_path', 'created_at')
+
+
+class UserCache:
+    """LRU of user snapshots with a time-to-live"""
+
+    def __init__(self, size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (stored_at, snapshot)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, snapshot):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def _snapshot(user):
+    porter = user.porter
+    return {
+        'user': {column: getattr(user, column) for column in USER_COLUMNS},
+        'porter': {column: getattr(porter, column) for column in PORTER_COLUMNS} if porter else None,
+    }
+
+
+def _restore(snapshot):
+    user = User(**snapshot['user'])
+    make_transient_to_detached(user)
+    porter = None
+    if snapshot['porter'] is not None:
+        porter = Porter(**snapshot['porter'])
+        make_transient_to_detached(porter)
+    set_committed_value(user, 'porter', porter)
+    # load=False trusts the snapshot instead of re-selecting the row
+    return db.session.merge(user, load=False)
+
+
+def _shared_key(user_id):
+    return f'user:{user_id}'
+
+
+def load_user(user_id):
+    """Return the user with their porter profile, from cache when possible"""
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        shared = get_backend().get(_shared_key(user_id))
+        if shared is not None:
+            snapshot = loads(shared)
+            user_cache.put(user_id, snapshot)
+    if snapshot is not None:
+        return _restore(snapshot)
+
+    user = db.session.get(User, user_id, options=[joinedload(User.porter)])
+    if user is not None:
+        snapshot = _snapshot(user)
+        user_cache.put(user_id, snapshot)
+        get_backend().set(_shared_key(user_id), dumps(snapshot), USER_CACHE_TTL)
+    return user
+
+
+@subscriber(INVALIDATION_CHANNEL)
+def _drop_local(message):
+    user_cache.invalidate(int(message))
+
+
+def invalidate(user_id):
+    """Drop a user's snapshot here, in the shared backend and in every other worker"""
+    user_cache.invalidate(user_id)
+    get_backend().delete(_shared_key(user_id))
+    get_backend().publish(INVALIDATION_CHANNEL, str(user_id))
+
+
+def _invalidate(target, user_id):
+    # This process stops serving the old snapshot straight away; the shared
+    # entry and other workers' copies go once the change is committed
+    user_cache.invalidate(user_id)
+    session = object_session(target)
+    if session is None:
+        invalidate(user_id)
+    else:
+        on_commit(session, lambda: invalidate(user_id))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Covers role and password changes along with everything else
+    _invalidate(target, target.id)
+
+
+@event.listens_for(Porter, 'after_insert')
+@event.listens_for(Porter, 'after_delete')
+def _porter_added_or_removed(mapper, connection, target):
+    _invalidate(target, target.user_id)
+
+
+@event.listens_for(Porter, 'after_update')
+def _porter_changed(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in PORTER_COLUMNS):
+        _invalidate(target, target.user_id)
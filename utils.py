@@ -1,33 +1,17 @@
-import os
+import time
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import abort
+from flask import abort, jsonify
 from flask_login import current_user
 import random
 import string
-from twilio.rest import Client
+from providers import get_sms_provider
+from pricing import quote
+from backends import get_backend
 
-# Twilio configuration
-TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
-TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
-
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-
-def calculate_price(weight, number_of_bags, trolley_required):
-    """Calculate the total price based on weight, number of bags, and trolley requirement"""
-    # Base price: Rs. 5 per kg
-    base_price = weight * 5
-    
-    # Additional charge for number of bags: Rs. 10 per bag
-    bag_charge = number_of_bags * 10
-    
-    # Trolley charge: Rs. 200 if required
-    trolley_charge = 200 if trolley_required else 0
-    
-    # Minimum charge: Rs. 100
-    total = base_price + bag_charge + trolley_charge
-    return max(total, 100)
+def calculate_price(weight, number_of_bags, trolley_required, station=None):
+    """Calculate the total price from the station's tariff (weight, bags, trolley, minimum charge)"""
+    return quote(weight, number_of_bags, trolley_required, station)
 
 def admin_required(f):
     """Decorator to check if user is admin"""
@@ -47,14 +31,30 @@ def porter_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def rate_limited(name, limit, period):
+    """Decorator allowing each user at most `limit` calls to a view per `period` seconds"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            window = int(time.time() // period)
+            key = f'ratelimit:{name}:{current_user.get_id()}:{window}'
+            if get_backend().incr(key, period) > limit:
+                retry_after = int(period - time.time() % period) + 1
+                response = jsonify({'error': f'Too many attempts. Try again in {retry_after} seconds.'})
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def format_currency(amount):
     """Format amount in Indian Rupees"""
     return f"₹{amount:.2f}"
 
 def generate_pdf_pass(booking):
-    """Generate PDF pass for booking"""
-    # Implementation using WeasyPrint would go here
-    pass
+    """Path of the booking's PDF pass, rendered on the pass pool if it is not cached"""
+    from passes import booking_pass
+    return booking_pass(booking.id)
 
 def generate_otp():
     """Generate a 6-digit OTP"""
@@ -63,10 +63,9 @@ def generate_otp():
 def send_otp_sms(phone_number, otp):
     """Send OTP via SMS using Twilio"""
     try:
-        message = client.messages.create(
-            body=f'Your PorterPro booking verification code is: {otp}. Valid for 10 minutes.',
-            from_=TWILIO_PHONE_NUMBER,
-            to=phone_number
+        get_sms_provider().send(
+            to=phone_number,
+            body=f'Your PorterPro booking verification code is: {otp}. Valid for 10 minutes.'
         )
         return True
     except Exception as e:
@@ -0,0 +1,162 @@
+"""
+Stripe webhook ingestion
+
+The webhook endpoint only verifies the signature and stores the event, once
+per event id, then acknowledges it; Stripe retries and duplicate deliveries
+are dropped by the primary key. worker.py applies stored events to
+Booking.payment_status in batches, so the webhook request never locks a
+booking row and a burst of payments becomes a few bulk UPDATEs.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime
+from sqlalchemy import or_, select, update
+from app import db
+from database import upsert_insert
+from models import Booking, StripeEvent
+from page_cache import invalidate_booking
+
+# Stripe's default tolerance for the signature timestamp, in seconds
+SIGNATURE_TOLERANCE = 300
+APPLY_BATCH_SIZE = 500
+
+# Event type -> payment_status, or a function of the checkout session for types that depend on it
+PAYMENT_STATUSES = {
+    'checkout.session.completed':
+        lambda session: 'paid' if session.get('payment_status') in ('paid', 'no_payment_required') else 'processing',
+    'checkout.session.async_payment_succeeded': 'paid',
+    'checkout.session.async_payment_failed': 'failed',
+    'checkout.session.expired': 'expired',
+}
+
+
+def sign(payload, secret, timestamp=None):
+    """Stripe-Signature header value for a payload, as Stripe computes it"""
+    timestamp = int(timestamp or time.time())
+    signed = f'{timestamp}.'.encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def verify_signature(payload, header, secret, tolerance=SIGNATURE_TOLERANCE):
+    """Raise ValueError unless `header` is a valid, recent Stripe signature of `payload`"""
+    timestamp = None
+    signatures = []
+    for part in (header or '').split(','):
+        key, _, value = part.partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise ValueError('Malformed Stripe-Signature header')
+    if abs(time.time() - int(timestamp)) > tolerance:
+        raise ValueError('Signature timestamp is outside the tolerance')
+
+    expected = sign(payload, secret, timestamp).split('v1=', 1)[1]
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise ValueError('Signature does not match')
+
+
+def parse_event(payload, header, secret=None):
+    """Verify and decode a webhook request body; raises ValueError if it is not a genuine event"""
+    secret = secret or os.environ.get('STRIPE_WEBHOOK_SECRET')
+    if not secret:
+        raise ValueError('STRIPE_WEBHOOK_SECRET is not set')
+    verify_signature(payload, header, secret)
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        raise ValueError('Malformed event')
+    if not isinstance(event, dict) or not isinstance(event.get('id'), str) \
+            or not isinstance(event.get('type'), str) or not isinstance(event.get('created'), int):
+        raise ValueError('Malformed event')
+    data = event.get('data')
+    if not isinstance(data, dict) or not isinstance(data.get('object'), dict):
+        raise ValueError('Malformed event data')
+    return event
+
+
+def record_event(event):
+    """Store an event for the consumer. Returns False if it was already stored."""
+    session = event['data']['object']
+    status = PAYMENT_STATUSES.get(event['type'])
+    if callable(status):
+        status = status(session)
+    reference = session.get('client_reference_id')
+
+    row = {
+        'id': event['id'],
+        'type': event['type'],
+        'booking_id': int(reference) if str(reference or '').isdigit() else None,
+        'session_id': session.get('id'),
+        'payment_status': status,
+        'created': datetime.utcfromtimestamp(event['created']),
+        'received_at': datetime.utcnow(),
+        # Events that do not change a payment are stored only to dedupe retries
+        'processed_at': None if status else datetime.utcnow(),
+    }
+    return db.session.execute(upsert_insert(StripeEvent).values(row).on_conflict_do_nothing(index_elements=['id'])).rowcount == 1
+
+
+def _claim(batch_size):
+    query = (
+        select(StripeEvent)
+        .where(StripeEvent.processed_at.is_(None))
+        .order_by(StripeEvent.created)
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        # Concurrent consumers take different events
+        query = query.with_for_update(skip_locked=True)
+    return db.session.scalars(query).all()
+
+
+def apply_pending(batch_size=APPLY_BATCH_SIZE, now=None):
+    """Apply one batch of stored events to their bookings, committing once.
+
+    Events are applied in the order Stripe created them, and a paid booking
+    is never moved back to another status. Returns the number of events.
+    """
+    now = now or datetime.utcnow()
+    events = _claim(batch_size)
+    if not events:
+        return 0
+
+    booking_ids = {event.booking_id for event in events if event.booking_id}
+    session_ids = {event.session_id for event in events if event.session_id}
+    bookings = db.session.execute(
+        select(Booking.id, Booking.stripe_session_id, Booking.payment_status)
+        .where(or_(Booking.id.in_(booking_ids), Booking.stripe_session_id.in_(session_ids)))
+    ).all()
+    by_session = {booking.stripe_session_id: booking.id for booking in bookings if booking.stripe_session_id}
+    current = {booking.id: booking.payment_status for booking in bookings}
+
+    statuses = dict(current)
+    for event in events:
+        booking_id = event.booking_id or by_session.get(event.session_id)
+        if booking_id not in statuses:
+            continue
+        if statuses[booking_id] == 'paid' and event.payment_status != 'paid':
+            continue
+        statuses[booking_id] = event.payment_status
+
+    changes = [
+        {'id': booking_id, 'payment_status': status}
+        for booking_id, status in statuses.items() if status != current[booking_id]
+    ]
+    if changes:
+        db.session.execute(update(Booking), changes)
+    db.session.execute(
+        update(StripeEvent)
+        .where(StripeEvent.id.in_([event.id for event in events]))
+        .values(processed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    for change in changes:
+        invalidate_booking(change['id'])
+    return len(events)
@@ -0,0 +1,78 @@
+"""
+Background worker for the outbound job queue (Stripe checkout, OTP SMS)
+and for applying stored Stripe webhook events to bookings
+
+    python worker.py                       # poll forever
+    python worker.py --once                # drain due jobs and exit
+    python worker.py --sweep-interval 60   # also run the housekeeping sweep every minute
+    python worker.py --pass-interval 300   # also render PDF passes for the next hour every 5 minutes
+"""
+import argparse
+import logging
+import threading
+import time
+from sqlalchemy.exc import DBAPIError
+from app import app, db
+import jobs
+import passes
+import sweeper
+import webhooks
+
+logger = logging.getLogger(__name__)
+
+
+def start_periodic(app, interval, task, name):
+    """Run task() in an app context every `interval` seconds on a daemon thread; set the returned event to stop it"""
+    stopped = threading.Event()
+
+    def loop():
+        while not stopped.is_set():
+            with app.app_context():
+                try:
+                    task()
+                except Exception:
+                    logger.exception('Periodic task %s failed', name)
+                    db.session.rollback()
+            stopped.wait(interval)
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
+    return stopped
+
+
+def run(batch_size=50, interval=1.0, once=False, sweep_interval=0, pass_interval=0):
+    if sweep_interval and not once:
+        start_periodic(app, sweep_interval, sweeper.sweep, 'sweeper')
+    if pass_interval and not once:
+        start_periodic(app, pass_interval, passes.pregenerate, 'passes')
+    with app.app_context():
+        jobs.requeue_stale()
+        while True:
+            try:
+                processed = jobs.run_batch(batch_size) + webhooks.apply_pending()
+            except DBAPIError as e:
+                if not e.connection_invalidated:
+                    raise
+                # The pool reconnects on the next checkout
+                logger.warning('Database connection lost, retrying: %s', e.orig)
+                db.session.rollback()
+                time.sleep(interval)
+                continue
+            if processed:
+                continue
+            if once:
+                return
+            time.sleep(interval)
+            jobs.requeue_stale()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the PorterPro job worker")
+    parser.add_argument("--batch-size", type=int, default=50, help="Jobs claimed per batch")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="Exit once no jobs are due")
+    parser.add_argument("--sweep-interval", type=float, default=0,
+                        help="Run the housekeeping sweep every this many seconds (0 disables)")
+    parser.add_argument("--pass-interval", type=float, default=0,
+                        help="Render PDF passes for bookings meeting in the next hour every this many seconds (0 disables)")
+    args = parser.parse_args()
+    run(args.batch_size, args.interval, args.once, args.sweep_interval, args.pass_interval)